@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+import numpy as np
+import Arbuckle.FieldGrid as fieldgrid
+
+# Binary cache of the parsed COMSOL component for field_map = Mesh.
+#
+# ComponentComsol.Initialise parses mesh.mphtxt, mplist.txt, epot<V>.txt and
+# wpot.txt as text on every rank at every launch. Factories.BuildComsolCache
+# parses them once and saves the resulting node, element, material and
+# potential arrays as raw .npy byte blocks under Cache/comsol_<key>/, where
+# the key hashes the mesh, material and weighting potential files. Each
+# voltage adds one potential block, pot_<hash of epot<V>.txt>.npy, so a
+# voltage sweep shares the mesh. Factories.Component then restores a
+# component by copying the memory-mapped blocks back in.
+
+CACHE_DIR = "Cache"
+# Garfield arrays held in the cache, in the block order of the native helper
+BLOCKS = ("nodes", "elements", "materials", "pot", "wpot")
+# Index of the potential, the only block that depends on the voltage
+POT = BLOCKS.index("pot")
+
+
+def CachePath(voltage):
+    mesh_files = [fn for fn in fieldgrid.ComsolFiles(voltage) if "epot" not in fn]
+    key = {"files": {fn: fieldgrid.FileHash(fn) for fn in mesh_files}}
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"comsol_{digest}")
+
+
+def PotentialPath(path, voltage):
+    digest = fieldgrid.FileHash("Comsol/epot"+str(voltage)+".txt")[:16]
+    return os.path.join(path, f"pot_{digest}.npy")
+
+
+def Save(path, blocks, item_sizes, info=None):
+    '''
+    blocks     = list of uint8 arrays, one per name in BLOCKS (the potential
+                 is saved separately with SavePotential)
+    item_sizes = bytes per record of each block, checked when loading so a
+                 cache written by a different Garfield build is not used
+    The manifest is written last, so a cache without one is incomplete.
+    '''
+    os.makedirs(path, exist_ok=True)
+    for name, block in zip(BLOCKS, blocks):
+        if name != "pot":
+            np.save(os.path.join(path, name+".npy"), block)
+    manifest = {"item_sizes": list(item_sizes), "info": info or {}}
+    with open(os.path.join(path, "manifest.json"), "w") as fh:
+        json.dump(manifest, fh, indent=2)
+
+
+def SavePotential(path, voltage, block):
+    os.makedirs(path, exist_ok=True)
+    target = PotentialPath(path, voltage)
+    tmp = target + ".tmp.npy"
+    np.save(tmp, block)
+    os.replace(tmp, target)
+
+
+def Exists(path, voltage=None):
+    # Mesh blocks present, and the potential of voltage if given
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        return False
+    return voltage is None or os.path.exists(PotentialPath(path, voltage))
+
+
+def LoadPotential(path, voltage):
+    return np.load(PotentialPath(path, voltage), mmap_mode="c")
+
+
+def Load(path, voltage):
+    '''
+    Returns (item_sizes, blocks), blocks memory-mapped copy-on-write
+    '''
+    with open(os.path.join(path, "manifest.json"), "r") as fh:
+        manifest = json.load(fh)
+    blocks = [LoadPotential(path, voltage) if name == "pot" else
+              np.load(os.path.join(path, name+".npy"), mmap_mode="c") for name in BLOCKS]
+
+    return manifest["item_sizes"], blocks
+
+
+if __name__ == '__main__':
+    quit()
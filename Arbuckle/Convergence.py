@@ -0,0 +1,198 @@
+import json
+import numpy as np
+
+# Online convergence checks for adaptive stopping (converge_* in the input
+# file). The Master feeds every collected batch of a job to its Monitor,
+# and stops handing out the job's events once every criterion set holds
+# at `patience` checks in a row:
+#
+# mean     : standard error of the mean charge, relative to the mean
+# peak     : relative change of the charge peak centroid and FWHM since the
+#            last check
+# waveform : relative (L2) change of the average waveform since the last check
+#
+# Checks run every `every` events once min_events are in, so the cost on
+# the Master does not grow with the batch rate.
+
+
+def Peak(charges, bins="fd"):
+    '''
+    (centroid, FWHM) of the main peak of the |charge| histogram, the centroid
+    is the mean of the bins within the half maximum. The half maximum
+    crossings are interpolated between bin centers.
+    '''
+    h, edges = np.histogram(np.abs(charges), bins=bins)
+    centers = 0.5*(edges[1:] + edges[:-1])
+    k = int(np.argmax(h))
+    half = 0.5*h[k]
+    below = np.flatnonzero(h[:k] < half)
+    lo = below[-1] + 1 if len(below) else 0
+    above = np.flatnonzero(h[k:] < half)
+    hi = k + above[0] - 1 if len(above) else len(h) - 1
+    weights = h[lo:hi+1]
+    centroid = float(np.sum(weights*centers[lo:hi+1])/np.sum(weights))
+    left = edges[0] if lo == 0 else np.interp(half, [h[lo-1], h[lo]], [centers[lo-1], centers[lo]])
+    right = edges[-1] if hi == len(h) - 1 else np.interp(half, [h[hi+1], h[hi]], [centers[hi+1], centers[hi]])
+
+    return centroid, float(right - left)
+
+
+def RelativeChange(new, old):
+    scale = np.abs(new) if np.ndim(new) == 0 else np.linalg.norm(new)
+    diff = np.abs(new - old) if np.ndim(new) == 0 else np.linalg.norm(new - old)
+    return float(diff/scale) if scale > 0 else float("inf")
+
+
+class Monitor:
+    '''
+    Running statistics of one job. Tolerances of None are not checked.
+    Update returns the stop reason once converged, else None.
+    '''
+
+    def __init__(self, mean=None, peak=None, waveform=None, min_events=100, every=50,
+                 patience=3, bins="fd"):
+        self.tol = {"mean": mean, "peak": peak, "waveform": waveform}
+        self.min_events = min_events
+        self.every = every
+        self.patience = patience
+        self.bins = bins
+        self.origin = None
+        self.width = None
+
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.charges = []
+        self.wave_sum = None
+        self.n_wave = 0
+
+        self.next_check = min_events
+        self.last = None
+        self.streak = 0
+        self.history = []
+        self.reason = None
+
+    def Update(self, charges, waveforms=None):
+        charges = np.asarray(charges, dtype=np.float64)
+        if len(charges) > 0:
+            # Running mean and variance, merged batch by batch (Chan et al.)
+            n_b = len(charges)
+            mean_b = charges.mean()
+            delta = mean_b - self.mean
+            n = self.n + n_b
+            self.m2 += np.sum((charges - mean_b)**2) + delta**2*self.n*n_b/n
+            self.mean += delta*n_b/n
+            self.n = n
+            self.charges.append(charges.copy())
+        if waveforms is not None and len(waveforms) > 0:
+            if self.wave_sum is None:
+                self.wave_sum = np.zeros(waveforms.shape[1])
+            self.wave_sum += waveforms.sum(axis=0)
+            self.n_wave += len(waveforms)
+
+        if self.reason is None and self.n >= self.next_check:
+            self.Check()
+            self.next_check = self.n + self.every
+        return self.reason
+
+    def Replay(self, charges, waveforms=None, rows=None):
+        # Events of a resumed run, fed every events at a time so the checks run
+        # as they did. waveforms[rows] are their waveforms (e.g. the memory-mapped
+        # waveforms of an event store), for the waveform criterion
+        for i in range(0, len(charges), self.every):
+            waves = None
+            if waveforms is not None and self.tol["waveform"] is not None:
+                waves = np.asarray(waveforms[rows[i:i+self.every]])
+            self.Update(charges[i:i+self.every], waves)
+        return self.reason
+
+    def Settings(self):
+        return {"tol": self.tol, "min_events": self.min_events, "every": self.every,
+                "patience": self.patience, "bins": self.bins}
+
+    def State(self):
+        # Stop of a converged monitor, to be kept with the job's events
+        return {"settings": self.Settings(), "reason": self.reason,
+                "n_events_checked": self.n, "checks": self.history}
+
+    def Restore(self, state):
+        # Stop of the original run from State() (read back from JSON), so a
+        # resumed run reports the stop it made rather than one replayed in
+        # event order. Ignored if the convergence settings have changed
+        if json.loads(json.dumps(self.Settings())) != state["settings"]:
+            return None
+        self.reason = state["reason"]
+        self.n = state["n_events_checked"]
+        self.history = state["checks"]
+        return self.reason
+
+    def Edges(self, charges):
+        # Histogram bins on a grid fixed at the first check, so the FWHM does
+        # not jump with the bin count as events come in
+        mag = np.abs(charges)
+        if self.width is None:
+            edges = np.histogram_bin_edges(mag, bins=self.bins)
+            self.origin = edges[0]
+            self.width = edges[1] - edges[0] if edges[1] > edges[0] else max(abs(edges[0]), 1.0)*1e-6
+        lo = np.floor((mag.min() - self.origin)/self.width)
+        hi = np.floor((mag.max() - self.origin)/self.width) + 1
+        return self.origin + self.width*np.arange(lo, hi + 1)
+
+    def Check(self):
+        charges = np.concatenate(self.charges)
+        self.charges = [charges]
+        sem = np.sqrt(self.m2/(self.n - 1)/self.n) if self.n > 1 else float("inf")
+        centroid, fwhm = Peak(charges, self.Edges(charges))
+        avg = self.wave_sum/self.n_wave if self.n_wave > 0 else None
+        stats = {"n_events": self.n,
+                 "mean": float(self.mean),
+                 "sem": float(sem),
+                 "rel_sem": float(sem/abs(self.mean)) if self.mean != 0 else float("inf"),
+                 "centroid": centroid,
+                 "fwhm": fwhm}
+
+        met = {}
+        if self.tol["mean"] is not None:
+            met["mean"] = stats["rel_sem"] <= self.tol["mean"]
+        if self.tol["peak"] is not None:
+            if self.last is not None:
+                stats["peak_change"] = max(RelativeChange(centroid, self.last["centroid"]),
+                                           RelativeChange(fwhm, self.last["fwhm"]))
+            met["peak"] = stats.get("peak_change", float("inf")) <= self.tol["peak"]
+        if self.tol["waveform"] is not None:
+            if avg is not None and self.last is not None and self.last["avg"] is not None:
+                stats["waveform_change"] = RelativeChange(avg, self.last["avg"])
+            met["waveform"] = stats.get("waveform_change", float("inf")) <= self.tol["waveform"]
+
+        self.history.append(stats)
+        self.last = dict(stats, avg=avg)
+        self.streak = self.streak + 1 if met and all(met.values()) else 0
+        if self.streak >= self.patience:
+            checks = {"mean": f"relative standard error {stats['rel_sem']:.3g} <= {self.tol['mean']}",
+                      "peak": f"peak change {stats.get('peak_change', 0):.3g} <= {self.tol['peak']}",
+                      "waveform": f"waveform change {stats.get('waveform_change', 0):.3g} <= {self.tol['waveform']}"}
+            self.reason = f"converged after {self.n} events: " + ", ".join(checks[k] for k in met)
+
+    def Report(self, n_events, n_run):
+        # Stop reason and the statistics of every check, for the JSON output.
+        # n_run counts the events still running at the stop as well
+        return {"reason": self.reason or f"n_events = {n_events} reached",
+                "converged": self.reason is not None,
+                "n_events_checked": self.n,
+                "n_events_run": n_run,
+                "checks": self.history}
+
+
+def FromConfig(cfg):
+    # Monitor of the converge_* settings of an input file, None if none is set
+    tols = [cfg.get("converge_mean"), cfg.get("converge_peak"), cfg.get("converge_waveform")]
+    if all(tol is None for tol in tols):
+        return None
+    return Monitor(*tols,
+                   min_events=cfg.get("converge_min_events", 100),
+                   every=cfg.get("converge_every", 50),
+                   patience=cfg.get("converge_patience", 3))
+
+
+if __name__ == '__main__':
+    quit()
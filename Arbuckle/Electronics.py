@@ -0,0 +1,187 @@
+import os
+import sys
+import math
+import numpy as np
+import Arbuckle.Seeding as seeding
+
+# Electronics response applied to blocks of induced-current waveforms
+# (n_events, nbin), so simulated signals compare with digitized preamp data:
+#
+#   1. Shaping, FFT convolution with either
+#      CR-RC : a charge-sensitive preamplifier followed by a CR-RC^n shaper,
+#              H(f) = gain * tau n! e^n/n^n / (1 + 2 pi i f tau)^(n+1),
+#              normalized so a unit charge gives a pulse of height gain
+#      file  : a measured impulse response (.npy or text), one column sampled
+#              at the signal bin width or two columns (t [ns], h)
+#   2. Resampling to the ADC period
+#   3. White and 1/f noise (rms, in output units), keyed on (seed, event)
+#   4. Digitization to adc_bits over adc_range, in ADC counts relative to
+#      the count of 0
+#
+# Every stage is optional. Used inline by main.py (see the Electronics
+# settings in the input file) or offline on saved outputs:
+#   python -m Arbuckle.Electronics Input.txt Outputs/signal.npy Outputs/signal_adc.npy
+
+CRRC = "cr-rc"
+
+
+def NextPow2(n):
+    return 1 << max(0, int(n - 1).bit_length())
+
+
+def LoadResponse(filename, bin_width):
+    # Measured impulse response on the signal bins
+    data = np.load(filename) if filename.endswith(".npy") else np.loadtxt(filename)
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        return data
+    t, h = data[:, 0], data[:, 1]
+    return np.interp(np.arange(0.0, t[-1], bin_width), t, h, left=0.0, right=0.0)
+
+
+class Chain:
+    '''
+    Electronics response of waveforms of nbin bins of bin_width [ns].
+    nbin_out, period = length and bin width [ns] of the output.
+    '''
+
+    def __init__(self, nbin, bin_width, shaping=None, order=4, tau=50.0, gain=1.0,
+                 noise_white=0.0, noise_pink=0.0, adc_bits=None, adc_range=(-1.0, 1.0),
+                 adc_period=None):
+        self.nbin = nbin
+        self.bin_width = bin_width
+        self.period = adc_period or bin_width
+        self.nbin_out = int(nbin*bin_width/self.period)
+
+        # Shaping, in the frequency domain over nfft bins so the response
+        # tail does not wrap around onto the start of the window
+        self.H = None
+        if shaping is not None and str(shaping).lower() == CRRC:
+            self.nfft = NextPow2(nbin + int(math.ceil(10*(order+1)*tau/bin_width)))
+            f = np.fft.rfftfreq(self.nfft, bin_width)
+            norm = tau*math.factorial(order)*math.exp(order)/order**order
+            self.H = gain*norm/(1.0 + 2j*np.pi*f*tau)**(order+1)
+        elif shaping is not None:
+            h = LoadResponse(shaping, bin_width)
+            self.nfft = NextPow2(nbin + len(h))
+            self.H = gain*bin_width*np.fft.rfft(h, self.nfft)
+
+        # 1/f noise filter on the output bins, scaled to unit rms
+        self.noise_white = noise_white or 0.0
+        self.noise_pink = noise_pink or 0.0
+        if self.noise_pink > 0:
+            f = np.fft.rfftfreq(self.nbin_out, self.period)
+            S = np.zeros(len(f))
+            S[1:] = 1.0/np.sqrt(f[1:])
+            self.S = S/np.sqrt(np.sum(np.fft.irfft(S, self.nbin_out)**2))
+
+        self.adc_bits = adc_bits
+        if adc_bits is not None:
+            lo, hi = adc_range
+            self.adc_lo = lo
+            self.lsb = (hi - lo)/2**adc_bits
+            self.zero = np.round(-lo/self.lsb)
+
+    def Shape(self, sigs):
+        if self.H is None:
+            return sigs
+        return np.fft.irfft(np.fft.rfft(sigs, self.nfft, axis=1)*self.H, self.nfft, axis=1)[:, :self.nbin]
+
+    def Resample(self, sigs):
+        # Linear interpolation at the start of every ADC period
+        if self.period == self.bin_width:
+            return sigs
+        p = np.arange(self.nbin_out)*self.period/self.bin_width
+        i = np.minimum(p.astype(np.int64), self.nbin-1)
+        j = np.minimum(i+1, self.nbin-1)
+        frac = p - i
+        return sigs[:, i]*(1.0 - frac) + sigs[:, j]*frac
+
+    def Noise(self, seed, events):
+        noise = np.zeros((len(events), self.nbin_out))
+        if self.noise_white <= 0 and self.noise_pink <= 0:
+            return noise
+        z = seeding.Normals(seed, events, 2*self.nbin_out, seeding.STREAM_NOISE)
+        if self.noise_white > 0:
+            noise += self.noise_white*z[:, :self.nbin_out]
+        if self.noise_pink > 0:
+            pink = np.fft.irfft(np.fft.rfft(z[:, self.nbin_out:], axis=1)*self.S, self.nbin_out, axis=1)
+            noise += self.noise_pink*pink
+        return noise
+
+    def Digitize(self, sigs):
+        if self.adc_bits is None:
+            return sigs
+        codes = np.clip(np.round((sigs - self.adc_lo)/self.lsb), 0, 2**self.adc_bits - 1)
+        return codes - self.zero
+
+    def Apply(self, sigs, seed=0, events=None):
+        '''
+        (n_events, nbin_out) response to an (n_events, nbin) block of signals.
+        The noise of row i is keyed on (seed, events[i]), events defaults to
+        the row numbers.
+        '''
+        sigs = np.atleast_2d(np.asarray(sigs, dtype=np.float64))
+        events = np.arange(len(sigs)) if events is None else np.asarray(events)
+        out = self.Resample(self.Shape(sigs)) + self.Noise(seed, events)
+        return self.Digitize(out)
+
+
+def FromConfig(cfg, nbin, bin_width):
+    # Chain of the electronics settings of an input file, None if every stage is off
+    keys = ("shaping", "noise_white", "noise_pink", "adc_bits", "adc_period")
+    if not any(cfg.get(key) for key in keys):
+        return None
+    return Chain(nbin, bin_width,
+                 shaping=cfg.get("shaping"),
+                 order=cfg.get("shaping_order", 4),
+                 tau=cfg.get("shaping_tau", 50.0),
+                 gain=cfg.get("shaping_gain", 1.0),
+                 noise_white=cfg.get("noise_white", 0.0),
+                 noise_pink=cfg.get("noise_pink", 0.0),
+                 adc_bits=cfg.get("adc_bits"),
+                 adc_range=cfg.get("adc_range", [-1.0, 1.0]),
+                 adc_period=cfg.get("adc_period"))
+
+
+def ApplyFile(cfg, filename, output, bin_width=None, block=1024):
+    '''
+    Apply the electronics settings of cfg to a saved waveform (.npy, one or
+    more rows) or to the waveforms of an event store directory, block by
+    block, and save the result to output (.npy)
+    '''
+    if os.path.isdir(filename):
+        from Arbuckle.EventStore import Open
+        waveforms, meta, manifest = Open(filename)
+        bin_width = manifest["bin_width"]
+    else:
+        waveforms = np.load(filename, mmap_mode="r")
+    if bin_width is None:
+        bin_width = cfg["tmax"]/waveforms.shape[-1]
+    single = waveforms.ndim == 1
+    waveforms = np.atleast_2d(waveforms)
+
+    chain = FromConfig(cfg, waveforms.shape[1], bin_width)
+    if chain is None:
+        raise Exception("No electronics stage is set in the input file")
+    seed = cfg.get("seed") or 0
+    if single:
+        np.save(output, chain.Apply(waveforms, seed)[0])
+        return chain
+    out = np.lib.format.open_memmap(output, mode="w+", dtype=np.float64,
+                                    shape=(len(waveforms), chain.nbin_out))
+    for i in range(0, len(waveforms), block):
+        out[i:i+block] = chain.Apply(waveforms[i:i+block], seed, np.arange(i, min(i+block, len(waveforms))))
+    out.flush()
+
+    return chain
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print("Use: python -m Arbuckle.Electronics Input.txt waveforms.npy|store_dir output.npy [bin_width_ns]")
+        sys.exit(1)
+    from Arbuckle.TxtInput import load_config
+    chain = ApplyFile(load_config(sys.argv[1]), sys.argv[2], sys.argv[3],
+                      float(sys.argv[4]) if len(sys.argv) > 4 else None)
+    print(f"Wrote {sys.argv[3]}: {chain.nbin_out} bins of {chain.period} ns")
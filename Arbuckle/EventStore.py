@@ -0,0 +1,158 @@
+import os
+import json
+import numpy as np
+
+# Per-event record written next to each waveform
+META_DTYPE = np.dtype([("event", "i8"),   # event ID
+                       ("charge", "f8"),  # integrated signal
+                       ("done", "?")])    # row has been written
+
+
+class EventStore:
+    '''
+    On-disk store of every event's waveform and metadata.
+
+    <path>/waveforms.npy : (n_events, nbin) float64, row i holds event i
+    <path>/events.npy    : n_events records of META_DTYPE
+    <path>/done.npy      : checkpointed mask of events safely on disk
+    <path>/manifest.json : run description and number of events checkpointed
+
+    Both arrays are preallocated .npy memmaps, so events are written in
+    place as they arrive, in any order, and the master only ever holds the
+    pages the OS has not yet flushed. The files are valid .npy at all times
+    and can be opened lazily with np.load(..., mmap_mode="r") while the run
+    is still going.
+
+    Every Flush is a checkpoint: the arrays are synced first and only then
+    is done.npy replaced, so it never marks an event whose waveform could
+    still be lost. With resume=True an existing store is reopened, rows
+    written after the last checkpoint are discarded, and Remaining() gives
+    the events that still have to run.
+    '''
+
+    def __init__(self, path, n_events, nbin, bin_width, info=None, flush_every=100,
+                 resume=False, ignore=()):
+        self.path = path
+        self.flush_every = flush_every
+        self.manifest = {"n_events": n_events,
+                         "nbin": nbin,
+                         "bin_width": bin_width,
+                         "n_done": 0,
+                         # as read back from manifest.json (tuples become lists),
+                         # so a resume compares like with like
+                         "info": json.loads(json.dumps(info or {}))}
+        mode = "w+"
+        if resume:
+            old = self.CheckResume(n_events, nbin, ignore)
+            # Keys the driver added to the manifest (e.g. a convergence stop) are kept
+            self.manifest = dict(old, **self.manifest)
+            mode = "r+"
+        os.makedirs(path, exist_ok=True)
+        self.waveforms = np.lib.format.open_memmap(
+            os.path.join(path, "waveforms.npy"), mode=mode,
+            dtype=np.float64, shape=(n_events, nbin))
+        self.meta = np.lib.format.open_memmap(
+            os.path.join(path, "events.npy"), mode=mode,
+            dtype=META_DTYPE, shape=(n_events,))
+        if resume:
+            self.meta["done"] = np.load(os.path.join(path, "done.npy"))
+            self.manifest["n_done"] = int(self.meta["done"].sum())
+        else:
+            self.meta["event"] = np.arange(n_events)
+        self.n_unflushed = 0
+        self.Flush()
+
+    def CheckResume(self, n_events, nbin, ignore=()):
+        # The stored run must match this one, apart from the info keys
+        # starting with a prefix in ignore (outputs, plots, scheduling)
+        old = Manifest(self.path)
+        if old is None:
+            raise Exception(f"No checkpoint found to resume from in {self.path}")
+        if old["n_events"] != n_events or old["nbin"] != nbin:
+            raise Exception(f"Checkpoint in {self.path} has {old['n_events']} events of "
+                            f"{old['nbin']} bins, requested {n_events} events of {nbin} bins")
+        info = self.manifest["info"]
+        for key in set(old["info"]) | set(info):
+            if key.startswith(tuple(ignore)):
+                continue
+            if old["info"].get(key) != info.get(key):
+                raise Exception(f"Checkpoint in {self.path} was run with {key} = "
+                                f"{old['info'].get(key)}, requested {info.get(key)}")
+        return old
+
+    def Remaining(self):
+        return np.flatnonzero(~self.meta["done"])
+
+    def Write(self, events, sigs):
+        # batches arrive in any order, each row is written once
+        self.waveforms[events] = sigs
+        self.meta["charge"][events] = sigs.sum(axis=1)
+        self.meta["done"][events] = True
+        self.manifest["n_done"] += len(events)
+        self.n_unflushed += len(events)
+        if self.n_unflushed >= self.flush_every:
+            self.Flush()
+
+    def Flush(self):
+        self.waveforms.flush()
+        self.meta.flush()
+        tmp = os.path.join(self.path, "done.tmp.npy")
+        np.save(tmp, np.asarray(self.meta["done"]))
+        os.replace(tmp, os.path.join(self.path, "done.npy"))
+        WriteJSON(os.path.join(self.path, "manifest.json"), self.manifest)
+        self.n_unflushed = 0
+
+    def Done(self):
+        # IDs of the events written, fewer than n_events when a run stopped early
+        return np.flatnonzero(self.meta["done"])
+
+    def Charges(self):
+        return np.array(self.meta["charge"][self.meta["done"]])
+
+    def Average(self, block=1024):
+        # Summed in event order, block by block, so the result does not
+        # depend on the order events arrived in or on resuming
+        avg = np.zeros(self.waveforms.shape[1])
+        done = np.asarray(self.meta["done"])
+        for i in range(0, len(self.waveforms), block):
+            avg += self.waveforms[i:i+block][done[i:i+block]].sum(axis=0)
+        return avg/max(int(done.sum()), 1)
+
+    def Close(self):
+        self.Flush()
+        del self.waveforms
+        del self.meta
+
+
+def WriteJSON(filename, data):
+    # Write to a temporary file first so a crash never leaves a partial file
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(data, fh, indent=2)
+    os.replace(tmp, filename)
+
+
+def Manifest(path):
+    # Manifest of the store at path, None if there is none yet
+    try:
+        with open(os.path.join(path, "manifest.json"), "r") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def Open(path):
+    '''
+    Lazily open a store written by EventStore.
+    Returns (waveforms, meta, manifest) with both arrays memory-mapped read-only.
+    '''
+    with open(os.path.join(path, "manifest.json"), "r") as fh:
+        manifest = json.load(fh)
+    waveforms = np.load(os.path.join(path, "waveforms.npy"), mmap_mode="r")
+    meta = np.load(os.path.join(path, "events.npy"), mmap_mode="r")
+
+    return waveforms, meta, manifest
+
+
+if __name__ == '__main__':
+    quit()
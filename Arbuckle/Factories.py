@@ -1,27 +1,47 @@
 import ROOT
 import Garfield # pyright: ignore[reportMissingImports]
 import Gasfiles.genGasfile
+import Arbuckle.Native as native
+import Arbuckle.Seeding as seeding
+import Arbuckle.Table as table
+import Arbuckle.FieldGrid as fieldgrid
+import Arbuckle.ComsolCache as comsolcache
+import Arbuckle.Profile as profile
 import ctypes
+import numpy as np
 
 def Medium(inputs):
+    '''
+    inputs = [Gas File, Ion Mobility File, Scaled Table (optional)]
+    Scaled Table = (gas file, pressure [Torr]) from Gasfiles.gasLibrary.Resolve,
+    a nearby table Garfield rescales to the requested gas density
+    '''
     gas = ROOT.Garfield.MediumMagboltz()
-    gas.LoadGasFile("Gasfiles/"+inputs[0])
+    if len(inputs) > 2 and inputs[2] is not None:
+        gas.LoadGasFile("Gasfiles/"+inputs[2][0])
+        gas.SetPressure(inputs[2][1])
+    else:
+        gas.LoadGasFile("Gasfiles/"+inputs[0])
     gas.LoadIonMobility(inputs[1])
     
     return gas
 
 def Component(inputs,gas):
+    '''
+    inputs = [Component Type, Voltage, Field Grid (None for the mesh), COMSOL Cache (optional)]
+    Field Grid   = (box, field, wfield, gas) arrays from Arbuckle.FieldGrid.Load
+    COMSOL Cache = (item sizes, blocks) from Arbuckle.ComsolCache.Load
+    '''
     cmp = None
-    if inputs[0] == "COMSOL":
-        cmp = ROOT.Garfield.ComponentComsol()
-        cmp.Initialise(
-            "Comsol/mesh.mphtxt",
-            "Comsol/mplist.txt", 
-            "Comsol/epot"+str(inputs[1])+".txt" 
-        )
-        cmp.SetWeightingPotential(
-            "Comsol/wpot.txt",
-            "W")
+    if inputs[0] == "COMSOL" and len(inputs) > 2 and inputs[2] is not None:
+        cmp = GridComponent(inputs[2],gas)
+
+    elif inputs[0] == "COMSOL":
+        if len(inputs) > 3 and inputs[3] is not None:
+            cmp = CachedComsol(inputs[3])
+        if cmp is None:
+            cmp = ROOT.Garfield.ComponentComsol()
+            ReadComsol(cmp,inputs[1])
         #Set the correct domains to belong to the medium class
         nMat = cmp.GetNumberOfMaterials()
         for i in range(nMat):
@@ -31,17 +51,169 @@ def Component(inputs,gas):
     
     return cmp
 
+def ReadComsol(cmp,voltage):
+    # Parse the COMSOL text files into a ComponentComsol
+    cmp.Initialise(
+        "Comsol/mesh.mphtxt",
+        "Comsol/mplist.txt", 
+        "Comsol/epot"+str(voltage)+".txt" 
+    )
+    cmp.SetWeightingPotential(
+        "Comsol/wpot.txt",
+        "W")
+
+def CachedComsol(cache):
+    # ComponentComsol restored from Arbuckle.ComsolCache blocks,
+    # None if the cache does not match this Garfield build
+    if not native.Declare("comsol"):
+        return None
+    item_sizes, blocks = cache
+    cmp = ROOT.ArbuckleNative.CachedComsol()
+    if [cmp.ItemSize(b,"W") for b in range(len(blocks))] != list(item_sizes):
+        print("COMSOL cache was written by a different Garfield build, reading the text files")
+        return None
+    for b, block in enumerate(blocks):
+        cmp.Import(b, "W", block, block.nbytes)
+    cmp.Finish()
+
+    return cmp
+
+def BuildComsolCache(inputs,gas,n_check=1000):
+    '''
+    inputs = [Voltage, Cache Path]
+    Parse the COMSOL text files once and save the parsed arrays to the cache,
+    or only the potential if the mesh of the cache is already saved.
+    A new mesh is restored and checked against the parsed one at n_check
+    random points first. Returns False if the cache could not be written.
+    '''
+    if not native.Declare("comsol") or not native.Declare("grid"):
+        return False
+    cmp = ROOT.ArbuckleNative.CachedComsol()
+    ReadComsol(cmp,inputs[0])
+    item_sizes = [cmp.ItemSize(b,"W") for b in range(len(comsolcache.BLOCKS))]
+    blocks = []
+    for b in range(len(comsolcache.BLOCKS)):
+        block = np.zeros(cmp.Bytes(b,"W"), dtype=np.uint8)
+        cmp.Export(b, "W", block)
+        blocks.append(block)
+    if comsolcache.Exists(inputs[1]):
+        comsolcache.SavePotential(inputs[1], inputs[0], blocks[comsolcache.POT])
+        return True
+
+    restored = CachedComsol((item_sizes, blocks))
+    for c in (cmp, restored):
+        for i in range(c.GetNumberOfMaterials()):
+            if c.GetPermittivity(i) == 1.0:
+                c.SetMedium(i,gas)
+    bounds = [ctypes.c_double(0.0) for _ in range(6)]
+    cmp.GetBoundingBox(*bounds)
+    box = np.array([b.value for b in bounds])
+    rng = np.random.default_rng(0)
+    points = np.ascontiguousarray(box[:3] + (box[3:]-box[:3])*rng.random((n_check, 3)))
+    fields = []
+    for c in (cmp, restored):
+        out = np.zeros((n_check, 4))
+        ROOT.ArbuckleNative.EvaluateField(c, points, n_check, out)
+        fields.append(out)
+    if not np.allclose(fields[0], fields[1], rtol=1e-12, atol=0.0):
+        print("Restored COMSOL component does not match the text files, cache not written")
+        return False
+
+    comsolcache.SavePotential(inputs[1], inputs[0], blocks[comsolcache.POT])
+    comsolcache.Save(inputs[1], blocks, item_sizes)
+    return True
+
+def SetVoltage(inputs,cmp,gas):
+    '''
+    inputs = [Voltage, Field Grid field array or None, COMSOL Cache potential block or None]
+    Swap the potential of a component made by Component, keeping its mesh and
+    weighting potential. Without either array the text files are read again.
+    '''
+    if inputs[1] is not None:
+        cmp.SetField(inputs[1])
+        box, field, wfield, gas_mask = held[id(cmp)]
+        held[id(cmp)] = (box, inputs[1], wfield, gas_mask)
+    elif inputs[2] is not None and hasattr(cmp, "SwapPotential"):
+        cmp.SwapPotential(inputs[2], inputs[2].nbytes)
+    else:
+        ReadComsol(cmp,inputs[0])
+        for i in range(cmp.GetNumberOfMaterials()):
+            if cmp.GetPermittivity(i) == 1.0:
+                cmp.SetMedium(i,gas)
+
+    return None
+
+# Arrays read in place by compiled components, by id of the component
+held = {}
+
+def GridComponent(arrays,gas):
+    # Component interpolating a regular-grid field map (Arbuckle.FieldGrid),
+    # the arrays may live in node-shared memory (Arbuckle.SharedMem)
+    if not native.Declare("grid"):
+        raise Exception("field_map = Grid needs the compiled grid component")
+    box, field, wfield, gas_mask = arrays
+    cmp = ROOT.ArbuckleNative.GridComponent()
+    cmp.SetGrid(*gas_mask.shape, box, field, wfield, gas_mask, gas, "W")
+    # the component reads these arrays in place, keep them alive with it
+    held[id(cmp)] = (box, field, wfield, gas_mask)
+
+    return cmp
+
+def Release(cmp):
+    # Drop the arrays held for a component that is no longer used
+    held.pop(id(cmp), None)
+
+def BuildFieldGrid(inputs,gas):
+    '''
+    inputs = [Voltage, Fidelity, Cache Path]
+    Sample the COMSOL field map on a regular grid and save it to the cache
+    '''
+    if not native.Declare("grid"):
+        raise Exception("field_map = Grid needs the compiled grid component")
+    cmp = Component(["COMSOL",inputs[0]],gas)
+
+    bounds = [ctypes.c_double(0.0) for _ in range(6)]
+    cmp.GetBoundingBox(*bounds)
+    box = np.array([b.value for b in bounds])
+    shape = fieldgrid.Shape(box,inputs[1])
+    field = np.zeros(shape+(4,))
+    wfield = np.zeros(shape+(4,))
+    gas_mask = np.zeros(shape, dtype=np.int32)
+    ROOT.ArbuckleNative.SampleGrid(cmp, "W", *shape, box, field, wfield, gas_mask)
+    fieldgrid.Save(inputs[2], box, field, wfield, gas_mask,
+                   info={"voltage": inputs[0], "sim_detail": inputs[1]})
+
+    return None
+
+# Signal bin width [ns] for each fidelity
+wbin = {"Coarse":20,"Normal":10,"Fine":5}
+
+def NBins(tmax,detail):
+    # number of signal bins for a time window of tmax [ns]
+    return int(tmax/wbin[detail])
+
+def TimeWindow(sens):
+    # (start [ns], bin width [ns], number of bins) of the time window of a Sensor
+    t0 = ctypes.c_double(0.0)
+    tstep = ctypes.c_double(0.0)
+    nbin = ctypes.c_size_t(0)
+    sens.GetTimeWindow(t0, tstep, nbin)
+    return t0.value, tstep.value, nbin.value
+
+def SensorBins(sens):
+    # number of bins in the time window of a Sensor
+    return TimeWindow(sens)[2]
+
 def Sensor(inputs,cmp):
     sens = ROOT.Garfield.Sensor()
     sens.AddComponent(cmp)
     sens.AddElectrode(cmp,"W")
-    wbin = {"Coarse":20,"Normal":10,"Fine":5}
-    nbin = int(inputs[0]/wbin[inputs[1]])
+    nbin = NBins(inputs[0],inputs[1])
     sens.SetTimeWindow(0,wbin[inputs[1]],nbin)
     
     return sens
 
-def Track(inputs,sens,vd):
+def Track(inputs,sens):
     track = ROOT.Garfield.TrackSrim()
     track.ReadFile("Srim/"+inputs[0])
     track.SetKineticEnergy(inputs[1]) # eV
@@ -49,18 +221,18 @@ def Track(inputs,sens,vd):
     track.SetTargetClusterSize(csize[inputs[2]]); # 50
     track.EnableTransverseStraggling(inputs[3])
     track.EnableLongitudinalStraggling(inputs[3])
-    track.EnablePlotting(vd)
     track.SetSensor(sens)
 
     return track
 
-def Drift(inputs,sens,vd):
+def Drift(inputs,sens):
     '''
     inputs = [Mode, Fidelity]
     '''
     drift = None
     
-    if inputs[0].lower() == "mc":
+    if inputs[0].lower() in ("mc","table"):
+        # Table mode drifts single electrons with AvalancheMC to build its templates
         drift = ROOT.Garfield.AvalancheMC()
         
         drift.SetTimeSteps(0.1)
@@ -70,121 +242,200 @@ def Drift(inputs,sens,vd):
     elif inputs[0].lower() == "micro":
         drift = ROOT.Garfield.AvalancheMicroscopic()
     
-    elif inputs[0].lowwer() == "rkf":
+    elif inputs[0].lower() == "rkf":
         drift = ROOT.Garfield.DriftLineRKF()
         
         stepsize = {"Coarse":0.3/10,"Normal":0.3/15,"Fine":0.3/20}
         drift.SetMaximumStepSize(stepsize[inputs[1]])
+        # Drift lines carry the signal of one electron, the gain is applied
+        # by DriftRKF (rkf_gain) so it is not counted twice
+        if hasattr(drift, "EnableAvalanche"):
+            drift.EnableAvalanche(False)
     
     else:
-        raise Exception("Invalid drift mode. Select from: \"MC\",\"Micro\",\"RKF\".")
+        raise Exception("Invalid drift mode. Select from: \"MC\",\"Micro\",\"RKF\",\"Table\".")
     
     drift.SetSensor(sens)
-    drift.EnablePlotting(vd)
     
     return drift
 
-def Source(src_type):
-    import math
-    
-    r = 0.149
+def Plotting(vd,track,drift):
+    # Record the track and drift lines of the next events in the ViewDrift vd,
+    # or stop recording with vd = None. Off by default, only plotted events record
+    if vd is None:
+        track.DisablePlotting()
+        drift.DisablePlotting()
+    else:
+        track.EnablePlotting(vd)
+        drift.EnablePlotting(vd)
 
-    if src_type.lower() == "plated":
-        
-        phi_max = 0.45*math.pi
-        z = 0.01
+def ReadSignals(sens,labels,nbin,out=None):
+    '''
+    Copy the signals of one or more electrodes into a (len(labels), nbin)
+    float64 array with a single call into C++.
+    '''
+    if out is None:
+        out = np.empty((len(labels), nbin))
+    if native.Declare("signals"):
+        ROOT.ArbuckleNative.ReadSignals(sens, labels, out, nbin)
+    else:
+        for j, label in enumerate(labels):
+            for i in range(nbin):
+                out[j,i] = sens.GetSignal(label,i)
 
-        rho = r * math.sqrt(ROOT.Garfield.Random.Draw())
-        angle = 2*math.pi * ROOT.Garfield.Random.Draw()
-        x = rho * math.cos(angle)
-        y = rho * math.sin(angle)
-        z = z
+    return out
 
-        # --- 2. Random direction inside a cone facing +z ---
-        phi = phi_max * ROOT.Garfield.Random.Draw()     # 0 → phi_max
-        theta = 2*math.pi * ROOT.Garfield.Random.Draw()
+def Clusters(track):
+    # (x, y, z, t, n) arrays of the clusters of the current track
+    clusters = [(c.x, c.y, c.z, c.t, c.n) for c in track.GetClusters()]
+    return np.array(clusters, dtype=float).reshape(-1, 5).T
 
-        dx = math.sin(phi) * math.cos(theta)
-        dy = math.sin(phi) * math.sin(theta)
-        dz = math.cos(phi) 
+def TablePoints(inputs,sens,drift,points):
+    '''
+    inputs = [Fidelity, Samples per Point]
+    Lookup table rows for the grid points with flat indices points:
+    mean signal of one electron released at t = 0, then the mean and
+    spread of its drift time. Points outside the gas give zeros.
+    '''
+    axes = table.Axes(inputs[0])
+    shape = tuple(len(a) for a in axes)
+    nbin = SensorBins(sens)
+    rows = np.zeros((len(points), nbin+2))
 
-    elif src_type.lower() == "collimated":
-        
-        x_min = -0.05
-        x_max = 0.05
-        z_min = 0.001
-        z_max = 0.15
-        phi_max=math.pi * 0.125
-
-        # --- 1. Sample uniformly from the rectangle in (x, z) ---
-        x = x_min + (x_max - x_min) * ROOT.Garfield.Random.Draw()
-        z = z_min + (z_max - z_min) * ROOT.Garfield.Random.Draw()
-
-        # --- 2. Project onto cylinder using your mapping ---
-        # theta = arccos(x / r)
-        # X = x
-        # Y = r*sin(theta) = sqrt(r^2 - x^2)
-        # -> ensures point lies on +y side (Y >= 0)
-        theta = math.acos(x / r)
-        y = r * math.sin(theta)
-
-        # --- 3. Sample direction inside cone facing -y ---
-        phi = phi_max * ROOT.Garfield.Random.Draw()           # 0 → phi_max
-        alpha = 2.0 * math.pi * ROOT.Garfield.Random.Draw()   # azimuth
-
-        dx =  math.sin(phi) * math.cos(alpha)
-        dy = -math.cos(phi)                       # axis along -y
-        dz =  math.sin(phi) * math.sin(alpha)
+    x0, y0, z0, t0 = (ctypes.c_double(0.0) for _ in range(4))
+    x1, y1, z1, t1 = (ctypes.c_double(0.0) for _ in range(4))
+    status = ctypes.c_int(0)
 
-    else:
-        raise Exception("Invalid Source Type")
-    
-    return [x, y, z, dx, dy, dz]
+    for p, point in enumerate(points):
+        i, j, k = np.unravel_index(point, shape)
+        x, y, z = axes[0][i], axes[1][j], axes[2][k]
+        # Tables do not depend on the run seed
+        ROOT.Garfield.Random.Seed(seeding.GarfieldSeed(0, int(point)))
+        sens.ClearSignal()
+        times = []
+        for _ in range(inputs[1]):
+            if not drift.DriftElectron(x, y, z, 0.0):
+                break
+            drift.GetElectronEndpoint(0, x0, y0, z0, t0, x1, y1, z1, t1, status)
+            times.append(t1.value)
+        if len(times) < inputs[1]:
+            continue
+        rows[p, :nbin] = ReadSignals(sens,["W"],nbin)[0]/inputs[1]
+        rows[p, nbin] = np.mean(times)
+        rows[p, nbin+1] = np.std(times)
 
-def Compute(inputs,sens,track,drift):
+    return rows
 
-    t0 = ctypes.c_double(0.0)
-    tstep = ctypes.c_double(0.0)
-    nbin = ctypes.c_size_t(0)
+def DriftRKF(inputs,sens,drift,clusters,index,seed,event):
+    '''
+    inputs = [Gain {None, "Mean", "Polya"}, Polya Theta, Diffusion]
+    Signal of clusters drifted along one RKF drift line each, from the
+    cluster start, weighted by the cluster's electron count.
+    index = number of each cluster in the whole track, so gain fluctuations
+            do not depend on how an event is split into parts
+    Gain "Mean" scales each cluster by the Townsend gain along its drift line,
+    "Polya" draws the total gain of its n electrons from the sum of n Polya
+    distributions of that mean (a Gamma distribution, by the Wilson-Hilferty
+    approximation). Diffusion spreads each cluster's signal by a Gaussian of
+    the arrival time spread along its drift line.
+    '''
+    gain, theta, diffusion = inputs
+    bin_width, nbin = TimeWindow(sens)[1:]
+    sig = np.zeros(nbin)
+    one = np.empty((1, nbin))
+    if gain is not None and gain.lower() == "polya":
+        k = np.array([c.n for c in clusters], dtype=float)*(theta + 1.0)
+        z = seeding.Normals(seed, [event], int(index[-1]) + 1 if len(index) else 0, seeding.STREAM_GAIN)[0][index]
+        polya = np.maximum(k*(1.0 - 1.0/(9.0*k) + z*np.sqrt(1.0/(9.0*k)))**3, 0.0)/(theta + 1.0)
 
-    sens.GetTimeWindow(t0, tstep, nbin)
-    nbin = nbin.value
+    for i, clstr in enumerate(clusters):
+        sens.ClearSignal()
+        drift.DriftElectron(clstr.x, clstr.y, clstr.z, clstr.t)
+        ReadSignals(sens, ["W"], nbin, out=one)
+        weight = clstr.n
+        if gain is not None:
+            weight = drift.GetGain()*(clstr.n if gain.lower() == "mean" else polya[i])
+        if diffusion:
+            sigma = drift.GetArrivalTimeSpread()/bin_width
+            if sigma > 0.1:
+                x = np.arange(-int(np.ceil(4*sigma)), int(np.ceil(4*sigma)) + 1)
+                kernel = np.exp(-0.5*(x/sigma)**2)
+                one[0] = np.convolve(one[0], kernel/kernel.sum(), mode="same")
+        sig += weight*one[0]
+    sens.ClearSignal()
+
+    return sig
+
+def Compute(inputs,sens,track,drift,lookup=None):
+    '''
+    inputs = [Mode, Source (x,y,z,dx,dy,dz), Run Seed, Event, Smear, Part, Parts, RKF]
+    Sources for a batch of events come from Arbuckle.Sources.Sample
+    lookup = Arbuckle.Table.Table for drift mode "Table", which applies
+             diffusion smearing when Smear is True
+    Part, Parts (optional, default 0, 1): drift only clusters Part, Part+Parts, ...
+             of the event's track, so one event can be split over several
+             workers and its parts summed. Every part generates the same track.
+    RKF (optional, default [None, 0.5, False]): inputs of DriftRKF for drift mode "RKF"
+    '''
+
+    t0 = 0.0
+    nbin = SensorBins(sens)
     
-    x, y, z, dx, dy, dz = Source(inputs[1])
+    # Both the source and Garfield's generator are keyed on (seed, event),
+    # so the event is the same on any rank
+    seed, event = inputs[2], inputs[3]
+    x, y, z, dx, dy, dz = inputs[1]
+    ROOT.Garfield.Random.Seed(seeding.GarfieldSeed(seed, event))
     
     sens.ClearSignal()
-    sig = []
-    track.NewTrack(x,y,z,t0,dx,dy,dz)
-
-    if inputs[0].lower() == "mc":
-        for clstr in track.GetClusters():
-            drift.AvalancheElectron(clstr.x,
-                                    clstr.y,
-                                    clstr.z,
-                                    clstr.t,
-                                    True,
-                                    clstr.n)
-            #drift.SetElectronSignalScalingFactor(clstr.n)
-            #drift.DriftElectron(clstr.x,clstr.y,clstr.z,clstr.t)
+    with profile.Timer("track"):
+        track.NewTrack(x,y,z,t0,dx,dy,dz)
+        clusters = track.GetClusters()
+    part, parts = (inputs[5], inputs[6]) if len(inputs) > 6 else (0, 1)
+    index = np.arange(part, len(clusters), parts)
+    if parts > 1:
+        # each part drifts with its own random numbers, keyed on (seed, event, part)
+        ROOT.Garfield.Random.Seed(seeding.GarfieldSeed(seed, event, seeding.STREAM_CLUSTERS + part))
+        clusters = [clusters[i] for i in index]
+    if profile.enabled:
+        profile.Count("events")
+        profile.Count("clusters", len(clusters))
+        profile.Count("electrons", sum(c.n for c in clusters))
+    with profile.Timer("avalanche"):
+        if inputs[0].lower() == "mc":
+            for clstr in clusters:
+                drift.AvalancheElectron(clstr.x,
+                                        clstr.y,
+                                        clstr.z,
+                                        clstr.t,
+                                        True,
+                                        clstr.n)
+                #drift.SetElectronSignalScalingFactor(clstr.n)
+                #drift.DriftElectron(clstr.x,clstr.y,clstr.z,clstr.t)
 
-    elif inputs[0].lower() == "micro":
-        for clstr in track.GetClusters():
-            drift.AvalancheElectron(clstr.x,
-                                    clstr.y,
-                                    clstr.z,
-                                    clstr.t,
-                                    0.1,
-                                    w = clstr.n)
-    #elif inputs[0].lower() == "RKF":
-    #    pass
-    else:
-        # Should never happen
-        print("Invalid drift module")
+        elif inputs[0].lower() == "micro":
+            for clstr in clusters:
+                drift.AvalancheElectron(clstr.x,
+                                        clstr.y,
+                                        clstr.z,
+                                        clstr.t,
+                                        0.1,
+                                        w = clstr.n)
+        elif inputs[0].lower() == "table":
+            x, y, z, t, n = Clusters(track)
+            return lookup.Synthesize(x, y, z, t, n, seed, event, inputs[4])
+
+        elif inputs[0].lower() == "rkf":
+            rkf = inputs[7] if len(inputs) > 7 else [None, 0.5, False]
+            return DriftRKF(rkf, sens, drift, clusters, index, seed, event)
+
+        else:
+            # Should never happen
+            print("Invalid drift module")
     
     #pack signal
-    for i in range(nbin):
-        sig.append(sens.GetSignal("W",i))
-
+    with profile.Timer("readout"):
+        sig = ReadSignals(sens,["W"],nbin)[0]
     return sig
 
 if __name__ == '__main__':
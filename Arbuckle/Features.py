@@ -0,0 +1,83 @@
+import numpy as np
+
+# Pulse features of induced-current waveforms, computed for a whole batch
+# of events at once. Workers send these in place of the waveforms, so the
+# Master only stores a few numbers per event (see waveform_every in the
+# input file). Times are in ns from the start of the time window.
+#
+# charge    : sum of the signal bins, as in the charge histogram
+# amplitude : signed value of the largest |signal|
+# t_peak    : time of the amplitude
+# t0        : first time |signal| reaches 10% of |amplitude|
+# rise_time : time from 10% to 90% of |amplitude|
+# tot       : time over threshold, |signal| above the threshold
+#             (half of |amplitude| when no threshold is given)
+FEATURES = ("charge", "amplitude", "t_peak", "t0", "rise_time", "tot")
+N_FEATURES = len(FEATURES)
+CHARGE = FEATURES.index("charge")
+
+DTYPE = np.dtype([("event", "i8")] + [(name, "f8") for name in FEATURES])
+
+
+def Crossing(mag, level):
+    # First (interpolated) bin at which each row of mag reaches level
+    rows = np.arange(len(mag))
+    i = np.argmax(mag >= level[:, None], axis=1)
+    prev = mag[rows, np.maximum(i-1, 0)]
+    cur = mag[rows, i]
+    step = np.where(cur > prev, cur - prev, 1.0)
+    return np.where(i > 0, i - 1 + (level - prev)/step, 0.0)
+
+
+def Extract(sigs, bin_width, threshold=None):
+    '''
+    (n_events, N_FEATURES) features of an (n_events, nbin) block of signals
+    with bins of bin_width [ns]. threshold = absolute level for tot.
+    Times are NaN for events with no signal.
+    '''
+    sigs = np.asarray(sigs, dtype=np.float64)
+    out = np.zeros((len(sigs), N_FEATURES))
+    if sigs.size == 0:
+        return out
+    rows = np.arange(len(sigs))
+    mag = np.abs(sigs)
+    peak_bin = np.argmax(mag, axis=1)
+    peak = mag[rows, peak_bin]
+    if threshold is None:
+        tot_level = 0.5*peak
+    else:
+        tot_level = np.full(len(sigs), float(threshold))
+
+    out[:, 0] = sigs.sum(axis=1)
+    out[:, 1] = sigs[rows, peak_bin]
+    out[:, 2] = peak_bin*bin_width
+    t10 = Crossing(mag, 0.1*peak)
+    out[:, 3] = t10*bin_width
+    out[:, 4] = (Crossing(mag, 0.9*peak) - t10)*bin_width
+    out[:, 5] = (mag >= tot_level[:, None]).sum(axis=1)*bin_width
+    out[peak == 0, 2:] = np.nan
+    out[peak == 0, 5] = 0.0
+
+    return out
+
+
+def Table(events, feats):
+    # Structured array of DTYPE, sorted by event
+    table = np.zeros(len(events), dtype=DTYPE)
+    table["event"] = events
+    for k, name in enumerate(FEATURES):
+        table[name] = feats[:, k]
+    return np.sort(table, order="event")
+
+
+def FromWaveforms(waveforms, bin_width, threshold=None, block=1024):
+    '''
+    Features of every row of a saved (n_events, nbin) array, e.g. the
+    memory-mapped waveforms of an event store, block by block
+    '''
+    return np.concatenate([Extract(waveforms[i:i+block], bin_width, threshold)
+                           for i in range(0, len(waveforms), block)] or [np.zeros((0, N_FEATURES))])
+
+
+if __name__ == '__main__':
+    quit()
@@ -0,0 +1,80 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# Regular-grid cache of the COMSOL field map for field_map = Grid.
+#
+# The field, potential and weighting field of the COMSOL component are
+# sampled once on a regular grid (Factories.BuildFieldGrid) and saved as
+# binary .npy arrays under Cache/field_<key>/, where the key hashes the
+# COMSOL input files and the grid spacing. Any change to those files gives
+# a new key, so a stale cache is never loaded. Factories.Component then
+# interpolates on the grid instead of searching the tetrahedral mesh.
+
+CACHE_DIR = "Cache"
+# Grid spacing [cm]
+SPACING = {"Coarse":0.01,"Normal":0.005,"Fine":0.0025}
+
+
+def FileHash(filename, block=1 << 20):
+    sha = hashlib.sha1()
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def ComsolFiles(voltage):
+    return ["Comsol/mesh.mphtxt",
+            "Comsol/mplist.txt",
+            "Comsol/epot"+str(voltage)+".txt",
+            "Comsol/wpot.txt"]
+
+
+def CachePath(voltage, detail):
+    key = {"files": {fn: FileHash(fn) for fn in ComsolFiles(voltage)},
+           "spacing": SPACING[detail]}
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"field_{digest}")
+
+
+def Shape(box, detail):
+    h = SPACING[detail]
+    return tuple(int(round((box[i+3]-box[i])/h))+1 for i in range(3))
+
+
+def Save(path, box, field, wfield, gas, info=None):
+    '''
+    field, wfield = (nx, ny, nz, 4) arrays of (Ex, Ey, Ez, V) and (Wx, Wy, Wz, W)
+    gas           = (nx, ny, nz) int32, 1 at nodes inside a drift medium
+    The manifest is written last, so a cache without one is incomplete.
+    '''
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "field.npy"), field)
+    np.save(os.path.join(path, "wfield.npy"), wfield)
+    np.save(os.path.join(path, "gas.npy"), gas)
+    manifest = {"box": list(box), "shape": list(gas.shape), "info": info or {}}
+    with open(os.path.join(path, "manifest.json"), "w") as fh:
+        json.dump(manifest, fh, indent=2)
+
+
+def Exists(path):
+    return os.path.exists(os.path.join(path, "manifest.json"))
+
+
+def Load(path):
+    '''
+    Returns (box, field, wfield, gas), arrays memory-mapped copy-on-write:
+    pages are shared with every other process mapping the cache until written
+    '''
+    with open(os.path.join(path, "manifest.json"), "r") as fh:
+        manifest = json.load(fh)
+    arrays = [np.load(os.path.join(path, name+".npy"), mmap_mode="c")
+              for name in ("field", "wfield", "gas")]
+
+    return (np.array(manifest["box"], dtype=float), *arrays)
+
+
+if __name__ == '__main__':
+    quit()
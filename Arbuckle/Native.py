@@ -0,0 +1,328 @@
+import ROOT
+import Garfield # pyright: ignore[reportMissingImports]
+
+# Small C++ helpers compiled by cling on first use. Each one replaces a Python
+# loop that would otherwise make one PyROOT call per element.
+_source = {
+"signals": r'''
+#include <string>
+#include <vector>
+#include "Garfield/Sensor.hh"
+
+namespace ArbuckleNative {
+// Copy nbin bins of each electrode signal into out[electrode][bin]
+void ReadSignals(Garfield::Sensor& sens, const std::vector<std::string>& labels,
+                 double* out, const std::size_t nbin) {
+  for (std::size_t j = 0; j < labels.size(); ++j) {
+    for (std::size_t i = 0; i < nbin; ++i) {
+      out[j * nbin + i] = sens.GetSignal(labels[j], i);
+    }
+  }
+}
+}
+''',
+"grid": r'''
+#include <algorithm>
+#include <array>
+#include <string>
+#include "Garfield/Component.hh"
+#include "Garfield/Medium.hh"
+
+namespace ArbuckleNative {
+// Regular grid over the box [xmin, xmax] x [ymin, ymax] x [zmin, zmax]
+// with nx*ny*nz nodes stored in C order
+struct Grid {
+  std::size_t nx = 0, ny = 0, nz = 0;
+  double xmin = 0., ymin = 0., zmin = 0.;
+  double xmax = 0., ymax = 0., zmax = 0.;
+  double dx = 1., dy = 1., dz = 1.;
+  void Set(std::size_t nx_, std::size_t ny_, std::size_t nz_, const double* box) {
+    nx = nx_; ny = ny_; nz = nz_;
+    xmin = box[0]; ymin = box[1]; zmin = box[2];
+    xmax = box[3]; ymax = box[4]; zmax = box[5];
+    dx = (xmax - xmin) / (nx - 1);
+    dy = (ymax - ymin) / (ny - 1);
+    dz = (zmax - zmin) / (nz - 1);
+  }
+  bool Inside(double x, double y, double z) const {
+    return x >= xmin && x <= xmax && y >= ymin && y <= ymax && z >= zmin && z <= zmax;
+  }
+  std::size_t Index(std::size_t i, std::size_t j, std::size_t k) const {
+    return (i * ny + j) * nz + k;
+  }
+};
+
+// Sample the field and potential (field) and the weighting field and
+// potential (wfield) of a component on a grid, 4 values per node. gas is 1
+// where the node lies in a drift medium.
+void SampleGrid(Garfield::Component& cmp, const std::string& label,
+                std::size_t nx, std::size_t ny, std::size_t nz, const double* box,
+                double* field, double* wfield, int* gas) {
+  Grid g;
+  g.Set(nx, ny, nz, box);
+  for (std::size_t i = 0; i < nx; ++i) {
+    const double x = g.xmin + i * g.dx;
+    for (std::size_t j = 0; j < ny; ++j) {
+      const double y = g.ymin + j * g.dy;
+      for (std::size_t k = 0; k < nz; ++k) {
+        const double z = g.zmin + k * g.dz;
+        const std::size_t n = g.Index(i, j, k);
+        double ex = 0., ey = 0., ez = 0., v = 0.;
+        Garfield::Medium* m = nullptr;
+        int status = 0;
+        cmp.ElectricField(x, y, z, ex, ey, ez, v, m, status);
+        gas[n] = (status == 0 && m && m->IsDriftable()) ? 1 : 0;
+        double wx = 0., wy = 0., wz = 0., wv = 0.;
+        if (status == 0 || status == -5) {
+          cmp.WeightingField(x, y, z, wx, wy, wz, label);
+          wv = cmp.WeightingPotential(x, y, z, label);
+        } else {
+          ex = ey = ez = v = 0.;
+        }
+        double* f = field + 4 * n;
+        f[0] = ex; f[1] = ey; f[2] = ez; f[3] = v;
+        double* w = wfield + 4 * n;
+        w[0] = wx; w[1] = wy; w[2] = wz; w[3] = wv;
+      }
+    }
+  }
+}
+
+// Component that interpolates the field, potential and weighting field
+// trilinearly on a regular grid. The arrays are not copied, they must stay
+// alive and unchanged for as long as the component is used.
+class GridComponent : public Garfield::Component {
+ public:
+  GridComponent() : Garfield::Component("ArbuckleGrid") { m_ready = true; }
+
+  void SetGrid(std::size_t nx, std::size_t ny, std::size_t nz, const double* box,
+               const double* field, const double* wfield, const int* gas,
+               Garfield::Medium* medium, const std::string& label) {
+    m_grid.Set(nx, ny, nz, box);
+    m_wfield = wfield;
+    m_gas = gas;
+    m_medium = medium;
+    m_label = label;
+    SetField(field);
+  }
+
+  // Swap in another potential sampled on the same grid
+  void SetField(const double* field) {
+    m_field = field;
+    m_vmin = m_vmax = field[3];
+    for (std::size_t n = 0; n < m_grid.nx * m_grid.ny * m_grid.nz; ++n) {
+      m_vmin = std::min(m_vmin, field[4 * n + 3]);
+      m_vmax = std::max(m_vmax, field[4 * n + 3]);
+    }
+  }
+
+  void ElectricField(const double x, const double y, const double z,
+                     double& ex, double& ey, double& ez,
+                     Garfield::Medium*& m, int& status) override {
+    double v = 0.;
+    ElectricField(x, y, z, ex, ey, ez, v, m, status);
+  }
+
+  void ElectricField(const double x, const double y, const double z,
+                     double& ex, double& ey, double& ez, double& v,
+                     Garfield::Medium*& m, int& status) override {
+    ex = ey = ez = v = 0.;
+    m = nullptr;
+    if (!m_grid.Inside(x, y, z)) {
+      status = -6;
+      return;
+    }
+    std::array<double, 4> f;
+    Interpolate(m_field, x, y, z, f);
+    ex = f[0]; ey = f[1]; ez = f[2]; v = f[3];
+    if (!InGas(x, y, z)) {
+      status = -5;
+      return;
+    }
+    m = m_medium;
+    status = 0;
+  }
+
+  Garfield::Medium* GetMedium(const double x, const double y, const double z) override {
+    return m_grid.Inside(x, y, z) && InGas(x, y, z) ? m_medium : nullptr;
+  }
+
+  void WeightingField(const double x, const double y, const double z,
+                      double& wx, double& wy, double& wz,
+                      const std::string& label) override {
+    wx = wy = wz = 0.;
+    if (label != m_label || !m_grid.Inside(x, y, z)) return;
+    std::array<double, 4> w;
+    Interpolate(m_wfield, x, y, z, w);
+    wx = w[0]; wy = w[1]; wz = w[2];
+  }
+
+  double WeightingPotential(const double x, const double y, const double z,
+                            const std::string& label) override {
+    if (label != m_label || !m_grid.Inside(x, y, z)) return 0.;
+    std::array<double, 4> w;
+    Interpolate(m_wfield, x, y, z, w);
+    return w[3];
+  }
+
+  bool GetVoltageRange(double& vmin, double& vmax) override {
+    vmin = m_vmin;
+    vmax = m_vmax;
+    return true;
+  }
+
+  bool GetBoundingBox(double& xmin, double& ymin, double& zmin,
+                      double& xmax, double& ymax, double& zmax) override {
+    xmin = m_grid.xmin; ymin = m_grid.ymin; zmin = m_grid.zmin;
+    xmax = m_grid.xmax; ymax = m_grid.ymax; zmax = m_grid.zmax;
+    return true;
+  }
+
+ private:
+  Grid m_grid;
+  const double* m_field = nullptr;
+  const double* m_wfield = nullptr;
+  const int* m_gas = nullptr;
+  Garfield::Medium* m_medium = nullptr;
+  std::string m_label = "W";
+  double m_vmin = 0., m_vmax = 0.;
+
+  void Cell(const double x, const double y, const double z,
+            std::size_t& i, std::size_t& j, std::size_t& k,
+            double& fx, double& fy, double& fz) const {
+    fx = (x - m_grid.xmin) / m_grid.dx;
+    fy = (y - m_grid.ymin) / m_grid.dy;
+    fz = (z - m_grid.zmin) / m_grid.dz;
+    i = std::min<std::size_t>(std::size_t(fx), m_grid.nx - 2);
+    j = std::min<std::size_t>(std::size_t(fy), m_grid.ny - 2);
+    k = std::min<std::size_t>(std::size_t(fz), m_grid.nz - 2);
+    fx -= i; fy -= j; fz -= k;
+  }
+
+  // A point is in the gas when its nearest grid node is
+  bool InGas(const double x, const double y, const double z) const {
+    std::size_t i, j, k;
+    double fx, fy, fz;
+    Cell(x, y, z, i, j, k, fx, fy, fz);
+    return m_gas[m_grid.Index(i + (fx > 0.5), j + (fy > 0.5), k + (fz > 0.5))] != 0;
+  }
+
+  void Interpolate(const double* data, const double x, const double y, const double z,
+                   std::array<double, 4>& out) const {
+    std::size_t i, j, k;
+    double fx, fy, fz;
+    Cell(x, y, z, i, j, k, fx, fy, fz);
+    out.fill(0.);
+    for (int c = 0; c < 8; ++c) {
+      const int oi = (c >> 2) & 1, oj = (c >> 1) & 1, ok = c & 1;
+      const double w = (oi ? fx : 1. - fx) * (oj ? fy : 1. - fy) * (ok ? fz : 1. - fz);
+      const double* d = data + 4 * m_grid.Index(i + oi, j + oj, k + ok);
+      for (int q = 0; q < 4; ++q) out[q] += w * d[q];
+    }
+  }
+};
+
+// Electric field of a component at n points (x, y, z), written as
+// (Ex, Ey, Ez, status) per point, for timing and accuracy studies
+void EvaluateField(Garfield::Component& cmp, const double* points, std::size_t n, double* out) {
+  for (std::size_t p = 0; p < n; ++p) {
+    double ex = 0., ey = 0., ez = 0., v = 0.;
+    Garfield::Medium* m = nullptr;
+    int status = 0;
+    cmp.ElectricField(points[3 * p], points[3 * p + 1], points[3 * p + 2],
+                      ex, ey, ez, v, m, status);
+    out[4 * p] = ex; out[4 * p + 1] = ey; out[4 * p + 2] = ez; out[4 * p + 3] = status;
+  }
+}
+}
+''',
+"comsol": r'''
+#include <cstring>
+#include <string>
+#include <type_traits>
+#include <vector>
+#include "Garfield/ComponentComsol.hh"
+
+namespace ArbuckleNative {
+// ComponentComsol whose parsed nodes, elements, materials and potentials can
+// be copied out to flat byte arrays and back, so the COMSOL text files are
+// parsed once (Arbuckle/ComsolCache.py). Blocks are copied with memcpy, which
+// only compiles while Garfield keeps them as vectors of plain records.
+class CachedComsol : public Garfield::ComponentComsol {
+ public:
+  // Blocks: 0 nodes, 1 elements, 2 materials, 3 potential, 4 weighting potential
+  std::size_t ItemSize(int block, const std::string& label) {
+    std::size_t size = 0;
+    Visit(block, label, [&](auto& v) { size = sizeof(v[0]); });
+    return size;
+  }
+
+  std::size_t Bytes(int block, const std::string& label) {
+    std::size_t size = 0;
+    Visit(block, label, [&](auto& v) { size = v.size() * sizeof(v[0]); });
+    return size;
+  }
+
+  void Export(int block, const std::string& label, unsigned char* out) {
+    Visit(block, label, [&](auto& v) { std::memcpy(out, v.data(), v.size() * sizeof(v[0])); });
+  }
+
+  void Import(int block, const std::string& label, const unsigned char* in, std::size_t n) {
+    Visit(block, label, [&](auto& v) {
+      v.resize(n / sizeof(v[0]));
+      std::memcpy(v.data(), in, n);
+    });
+  }
+
+  // Call once every block is imported. Media belong to the process that
+  // wrote the cache, they are cleared and set again with SetMedium.
+  void Finish() {
+    for (auto& m : m_materials) m.medium = nullptr;
+    m_ready = true;
+    SetRange();
+    UpdatePeriodicity();
+  }
+
+  // Replace the potential with another one on the same mesh (voltage sweep)
+  void SwapPotential(const unsigned char* in, std::size_t n) {
+    Import(3, "", in, n);
+    SetRange();
+  }
+
+ private:
+  template <class F>
+  void Visit(int block, const std::string& label, F f) {
+    switch (block) {
+      case 0: Check(m_nodes); f(m_nodes); break;
+      case 1: Check(m_elements); f(m_elements); break;
+      case 2: Check(m_materials); f(m_materials); break;
+      case 3: Check(m_pot); f(m_pot); break;
+      case 4: Check(m_wpot[label]); f(m_wpot[label]); break;
+    }
+  }
+
+  template <class T>
+  static void Check(const std::vector<T>&) {
+    static_assert(std::is_trivially_copyable<T>::value, "block is not a flat array");
+  }
+};
+}
+''',
+}
+
+_declared = {}
+
+def Declare(name):
+    '''
+    Compile the named helper once per process.
+    Returns False if cling rejects it.
+    '''
+    if name not in _declared:
+        _declared[name] = bool(ROOT.gInterpreter.Declare(_source[name]))
+        if not _declared[name]:
+            print(f"Could not compile native helper \"{name}\"")
+    return _declared[name]
+
+
+if __name__ == '__main__':
+    quit()
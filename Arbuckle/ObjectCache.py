@@ -0,0 +1,65 @@
+import collections
+
+# Least-recently-used cache of Garfield object sets for batch runs.
+#
+# Configurations in a batch are keyed by the input values their Garfield
+# objects are built from, so configurations that only differ in, say, the
+# source type or the seed reuse the same objects. The least recently used
+# set is dropped when the cache is full or the node runs short of memory.
+
+
+def FreeMemoryMB():
+    # Memory available to new allocations, None where it cannot be read
+    try:
+        with open("/proc/meminfo", "r") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return None
+
+
+class ObjectCache:
+    '''
+    max_entries = most object sets held at once
+    min_free_mb = evict while less memory than this is available (None to ignore)
+    release     = called on every evicted object set
+    '''
+
+    def __init__(self, max_entries=4, min_free_mb=None, release=None):
+        self.entries = collections.OrderedDict()
+        self.max_entries = max(1, max_entries)
+        self.min_free_mb = min_free_mb
+        self.release = release
+        self.builds = 0
+        self.evictions = 0
+
+    def Get(self, key, build):
+        # Object set for key, built with build() on a miss
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        while self.entries and (len(self.entries) >= self.max_entries or self.Tight()):
+            self.Evict()
+        obj = build()
+        self.entries[key] = obj
+        self.builds += 1
+
+        return obj
+
+    def Tight(self):
+        if self.min_free_mb is None:
+            return False
+        free = FreeMemoryMB()
+        return free is not None and free < self.min_free_mb
+
+    def Evict(self):
+        key, obj = self.entries.popitem(last=False)
+        if self.release is not None:
+            self.release(obj)
+        self.evictions += 1
+
+
+if __name__ == '__main__':
+    quit()
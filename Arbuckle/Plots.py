@@ -0,0 +1,83 @@
+import os
+import numpy as np
+import ROOT
+import Garfield # pyright: ignore[reportMissingImports]
+
+# Plots of a run, drawn after the events are done so they never hold up
+# the workers (plot_* in the input file). Every plot is saved to an image
+# file in plot_dir; canvases are only kept open with plot_interactive = True.
+
+# Viewing plane (xz) and area of the field and drift line plots [cm]
+PLANE = (-1, 0, 0, 0, 0, 0)
+AREA = (-.23, -.23, -0.04, .23, .23, 0.34)
+
+canvases = []
+
+
+def Canvas(name):
+    c = ROOT.TCanvas(name, "", 600, 600)
+    canvases.append(c)
+    return c
+
+
+def Save(c, plot_dir, name):
+    path = os.path.join(plot_dir, name)
+    c.SaveAs(path)
+    return path
+
+
+def Velocity(gas, carrier, plot_dir, name):
+    # carrier = "e" or "i"
+    c = Canvas(name)
+    gas.PlotVelocity(carrier, c)
+    return Save(c, plot_dir, name)
+
+
+def Mesh(cmp, plot_dir, name="mesh.png"):
+    c = Canvas(name)
+    vm = ROOT.Garfield.ViewFEMesh()
+    vm.SetComponent(cmp)
+    vm.SetPlane(0, -1, 0, 0, 0, 0)
+    vm.SetFillMesh(True)
+    vm.SetArea(-0.5, -0.5, -0.5, 0.5, 0.5, 0.5)
+    vm.SetCanvas(c)
+    vm.Plot()
+    return Save(c, plot_dir, name)
+
+
+def Field(cmp, voltage, plot_dir, name="field.png"):
+    c = Canvas(name)
+    vf = ROOT.Garfield.ViewField()
+    vf.SetComponent(cmp)
+    vf.SetPlane(*PLANE)
+    vf.SetArea(*AREA)
+    vf.SetVoltageRange(-voltage, 0.)
+    c.SetLeftMargin(0.16)
+    vf.SetCanvas(c)
+    vf.PlotContour()
+    return Save(c, plot_dir, name)
+
+
+def DriftLines(vd, plot_dir, name):
+    # vd = ViewDrift the track and drift lines of an event were recorded in
+    c = Canvas(name)
+    vd.SetPlane(*PLANE)
+    vd.SetArea(*AREA)
+    vd.SetCanvas(c)
+    vd.Plot(True)
+    return Save(c, plot_dir, name)
+
+
+def Signal(sig, bin_width, plot_dir, name):
+    # Signal of an event as written to the outputs, bins of bin_width [ns]
+    c = Canvas(name)
+    t = np.arange(len(sig), dtype=np.float64)*bin_width
+    g = ROOT.TGraph(len(sig), t, np.ascontiguousarray(sig, dtype=np.float64))
+    g.SetTitle(";time [ns];signal")
+    g.Draw("AL")
+    canvases.append(g)
+    return Save(c, plot_dir, name)
+
+
+if __name__ == '__main__':
+    quit()
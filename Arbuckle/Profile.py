@@ -0,0 +1,140 @@
+import json
+import time
+import socket
+import contextlib
+import numpy as np
+
+# Per-phase timers and counters for profiling runs (f_profile in the input
+# file). Every rank records its own; Report gathers them on the master and
+# writes one JSON file with per-rank totals, load imbalance and idle time.
+#
+# While disabled, Timer returns a shared do-nothing context manager and
+# Count returns at once, so the instrumentation left in the code costs one
+# function call per use.
+
+enabled = False
+timers = {}    # phase -> [seconds, calls]
+counters = {}  # name -> total
+
+_off = contextlib.nullcontext()
+
+# Phases counted as useful work and as waiting for the load summary
+BUSY = ("compute",)
+IDLE = ("mpi_wait", "pool_wait")
+
+
+def Enable(on=True):
+    global enabled
+    enabled = on
+
+
+class _Timer:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        Add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+def Timer(name):
+    # with Timer("phase"): ... adds the time spent to phase
+    return _Timer(name) if enabled else _off
+
+
+def Add(name, seconds, calls=1):
+    if not enabled:
+        return
+    entry = timers.setdefault(name, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += calls
+
+
+def Count(name, value=1):
+    if not enabled:
+        return
+    counters[name] = counters.get(name, 0) + value
+
+
+def Reset():
+    timers.clear()
+    counters.clear()
+
+
+def Take():
+    # Timers and counters recorded since the last Take, cleared, for Merge
+    # into another process's (Scheduler.Pool sends them back with results)
+    if not enabled:
+        return None
+    data = {"timers": dict(timers), "counters": dict(counters)}
+    Reset()
+    return data
+
+
+def Merge(data):
+    if data is None:
+        return
+    for name, (seconds, calls) in data["timers"].items():
+        Add(name, seconds, calls)
+    for name, value in data["counters"].items():
+        Count(name, value)
+
+
+def Summary(ranks):
+    '''
+    Spread of every phase over the ranks and the load balance of the run.
+    imbalance = max/mean over ranks (1 is perfect balance)
+    '''
+    phases = {}
+    for name in sorted({name for r in ranks for name in r["timers"]}):
+        t = np.array([r["timers"].get(name, {"s": 0.0})["s"] for r in ranks])
+        phases[name] = {"min_s": float(t.min()), "mean_s": float(t.mean()), "max_s": float(t.max()),
+                        "imbalance": float(t.max()/t.mean()) if t.mean() > 0 else 1.0}
+
+    busy = np.array([r["busy_s"] for r in ranks])
+    working = busy > 0
+    return {"phases": phases,
+            "load_imbalance": float(busy[working].max()/busy[working].mean()) if working.any() else 1.0,
+            "idle_fraction": [r["idle_s"]/r["wall_s"] if r["wall_s"] > 0 else 0.0 for r in ranks],
+            "counters": {name: float(sum(r["counters"].get(name, 0) for r in ranks))
+                         for name in sorted({name for r in ranks for name in r["counters"]})}}
+
+
+def Report(comm, path, wall, info=None):
+    '''
+    Gather every rank's timers and counters on rank 0 and write them to
+    path as JSON. wall = this rank's wall time [s]. Collective over comm.
+    '''
+    if not enabled:
+        return None
+    mine = {"rank": comm.Get_rank(),
+            "host": socket.gethostname(),
+            "wall_s": wall,
+            "busy_s": sum(timers.get(name, [0.0])[0] for name in BUSY),
+            "idle_s": sum(timers.get(name, [0.0])[0] for name in IDLE),
+            "timers": {name: {"s": s, "calls": n} for name, (s, n) in timers.items()},
+            "counters": dict(counters)}
+    ranks = comm.gather(mine, root=0)
+    if comm.Get_rank() != 0:
+        return None
+
+    report = {"n_ranks": len(ranks),
+              "wall_s": max(r["wall_s"] for r in ranks),
+              "info": info or {},
+              "summary": Summary(ranks),
+              "ranks": ranks}
+    with open(path, "w") as fh:
+        json.dump(report, fh, indent=2, default=str)
+    print(f"Profile written to {path}")
+
+    return report
+
+
+if __name__ == '__main__':
+    quit()
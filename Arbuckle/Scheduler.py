@@ -0,0 +1,330 @@
+import os
+import time
+import multiprocessing
+import functools
+import concurrent.futures
+import numpy as np
+import Arbuckle.Profile as profile
+try:
+    from mpi4py import MPI
+except ImportError:
+    # Without mpi4py only the local backend (Pool) is available
+    MPI = None
+
+# Message tags
+TAG_STOP = 0
+TAG_WORK = 1
+TAG_RESULT = 2  # event IDs of a finished batch
+TAG_SIGNAL = 3  # float64 signal rows of a finished batch
+
+
+def WaitForMessage(comm, source=None, tag=None, status=None, max_sleep=0.05):
+    '''
+    Sleep until a matching message is pending.
+
+    Blocking receives busy-poll inside most MPI libraries, so an idle rank
+    would burn a full core. Backing off with short sleeps keeps idle ranks
+    near 0% CPU and adds at most max_sleep [s] of latency per message, which
+    is negligible next to event times of seconds.
+    '''
+    source = MPI.ANY_SOURCE if source is None else source
+    tag = MPI.ANY_TAG if tag is None else tag
+    delay = 1e-4
+    while not comm.Iprobe(source=source, tag=tag, status=status):
+        time.sleep(delay)
+        delay = min(2*delay, max_sleep)
+
+
+def ChunkSize(remaining, n_ranks, policy="Guided", chunk_size=8, chunk_min=1):
+    '''
+    Number of events to hand out in the next batch.
+
+    Fixed  : always chunk_size
+    Guided : remaining/(2*n_ranks), clipped to [chunk_min, chunk_size], so
+             batches shrink near the end of the run and no rank is left
+             holding a large batch while the others sit idle
+    '''
+    if policy.lower() == "fixed":
+        n = chunk_size
+    elif policy.lower() == "guided":
+        n = -(-remaining // (2*n_ranks))
+        n = max(chunk_min, min(chunk_size, n))
+    else:
+        raise Exception("Invalid chunk policy. Select from: \"Fixed\",\"Guided\".")
+
+    return max(1, min(n, remaining))
+
+
+def Take(todo, start, n, skip=None):
+    '''
+    Next n event IDs of todo from position start, leaving out the events
+    skip(events) marks True. Returns (events, next position, number left out)
+    '''
+    batch = []
+    n_skipped = 0
+    while n > 0 and start < len(todo):
+        events = todo[start:start+n]
+        start += len(events)
+        if skip is not None:
+            dropped = np.asarray(skip(events), dtype=bool)
+            n_skipped += int(np.count_nonzero(dropped))
+            events = events[~dropped]
+        batch.append(events)
+        n -= len(events)
+    return (np.concatenate(batch) if batch else todo[:0]), start, n_skipped
+
+
+def Master(comm, todo, nbin, compute, collect, master_compute=True,
+           chunk_policy="Guided", chunk_size=8, chunk_min=1, report=50, skip=None):
+    '''
+    Hand out batches of the event IDs in todo to the workers and gather
+    their results.
+
+    compute(events) -> signals : runs a batch of events on this rank and
+                                 returns a (len(events), width) array,
+                                 width <= nbin and fixed within a batch
+    collect(events, signals)   : aggregates one finished batch
+
+    Work and results travel as raw int64/float64 buffers: a batch is sent as
+    its event IDs and answered with the same IDs followed by the signal rows,
+    received into preallocated buffers. The arrays passed to
+    collect are views of those buffers and are overwritten by the next batch,
+    so collect must copy anything it keeps.
+
+    With master_compute, rank 0 runs batches of chunk_min events itself
+    between servicing the workers. Each worker then keeps a second batch
+    queued so it never waits on the master while the master is busy.
+
+    skip(events) -> mask, checked as events are handed out, leaves out the
+    events it marks True, e.g. those of a job that has already converged.
+    Batches already sent still finish and are collected.
+    '''
+    size = comm.Get_size()
+    if size == 1:
+        master_compute = True
+    depth = 2 if master_compute else 1
+    n_ranks = size if master_compute else size-1
+    status = MPI.Status()
+
+    todo = np.ascontiguousarray(todo, dtype=np.int64)
+    n_events = len(todo)
+    max_batch = max(chunk_size, chunk_min)
+    ids_buf = np.empty(max_batch, dtype=np.int64)
+    sig_buf = np.empty((max_batch, nbin), dtype=np.float64)
+
+    next_event = 0
+    n_done = 0
+    n_skipped = 0
+
+    def next_batch(n):
+        nonlocal next_event, n_skipped
+        events, next_event, n = Take(todo, next_event, n, skip)
+        n_skipped += n
+        return events
+
+    def send_work(rnk):
+        n = ChunkSize(n_events-next_event, n_ranks, chunk_policy, chunk_size, chunk_min)
+        batch = next_batch(n)
+        if len(batch) == 0:
+            return
+        comm.Send(batch, dest=rnk, tag=TAG_WORK)
+        profile.Count("bytes_sent", batch.nbytes)
+
+    def finish(events, signals):
+        nonlocal n_done
+        with profile.Timer("collect"):
+            collect(events, signals)
+        if (n_done + len(events))//report > n_done//report or n_done == 0:
+            print(f"{n_done + len(events)} of {n_events} events complete")
+        n_done += len(events)
+
+    for _ in range(depth):
+        for rnk in range(1, size):
+            if next_event < n_events:
+                send_work(rnk)
+
+    while n_done + n_skipped < n_events:
+        # Drain every result that has already arrived
+        while comm.Iprobe(source=MPI.ANY_SOURCE, tag=TAG_RESULT, status=status):
+            worker = status.Get_source()
+            n = status.Get_count(MPI.INT64_T)
+            comm.Recv([ids_buf, n, MPI.INT64_T], source=worker, tag=TAG_RESULT)
+            comm.Probe(source=worker, tag=TAG_SIGNAL, status=status)
+            width = status.Get_count(MPI.DOUBLE)//n
+            comm.Recv([sig_buf, n*width, MPI.DOUBLE], source=worker, tag=TAG_SIGNAL)
+            profile.Count("bytes_received", 8*n*(1 + width))
+            if next_event < n_events:
+                send_work(worker)
+            finish(ids_buf[:n], sig_buf.reshape(-1)[:n*width].reshape(n, width))
+
+        if n_done + n_skipped == n_events:
+            break
+
+        if master_compute and next_event < n_events:
+            events = next_batch(min(chunk_min, n_events-next_event))
+            if len(events) > 0:
+                with profile.Timer("compute"):
+                    sigs = compute(events)
+                finish(events, sigs)
+        else:
+            with profile.Timer("mpi_wait"):
+                WaitForMessage(comm, tag=TAG_RESULT)
+
+    for rnk in range(1, size):
+        comm.Send(ids_buf[:0], dest=rnk, tag=TAG_STOP)
+
+
+def Worker(comm, compute):
+    '''
+    Run batches of events sent by the master until told to stop.
+    Each batch is answered with its event IDs and one contiguous float64
+    block of signals.
+    '''
+    status = MPI.Status()
+    pending = []  # (request, buffer) pairs kept alive until the send completes
+
+    while True:
+        with profile.Timer("mpi_wait"):
+            WaitForMessage(comm, source=0, status=status)
+        events = np.empty(status.Get_count(MPI.INT64_T), dtype=np.int64)
+        comm.Recv(events, source=0, tag=status.Get_tag())
+        if status.Get_tag() == TAG_STOP:
+            break
+        profile.Count("bytes_received", events.nbytes)
+
+        with profile.Timer("compute"):
+            sigs = np.ascontiguousarray(compute(events), dtype=np.float64)
+        pending.append((comm.Isend(events, dest=0, tag=TAG_RESULT), events))
+        pending.append((comm.Isend(sigs, dest=0, tag=TAG_SIGNAL), sigs))
+        profile.Count("bytes_sent", events.nbytes + sigs.nbytes)
+        # Release sends that have already completed
+        pending = [(req, buf) for req, buf in pending if not req.Test()]
+
+    with profile.Timer("mpi_wait"):
+        MPI.Request.Waitall([req for req, buf in pending])
+
+
+# Set in every rank by the MPI launchers (Open MPI, MPICH/Hydra, PMIx, Slurm srun)
+LAUNCHER_VARS = ("OMPI_COMM_WORLD_SIZE", "PMI_SIZE", "PMIX_RANK")
+
+
+def Launched():
+    # Whether this process was started by an MPI launcher, even as a single rank
+    return MPI is not None and any(var in os.environ for var in LAUNCHER_VARS)
+
+
+def Cores():
+    # CPUs this process may run on
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _PoolInit(initializer):
+    # Forked processes start with this one's timers, keep only their own
+    profile.Reset()
+    if initializer is not None:
+        initializer()
+
+
+def _PoolCompute(compute, events):
+    with profile.Timer("compute"):
+        sigs = compute(events)
+    return sigs, profile.Take()
+
+
+def Pool(todo, nbin, compute, collect, processes=None, initializer=None,
+         chunk_policy="Guided", chunk_size=8, chunk_min=1, report=50, skip=None):
+    '''
+    Local backend of Master: the same batches run on a pool of processes
+    on this machine, for runs without an MPI launcher.
+
+    compute and collect are as for Master; collect gets each batch as it
+    finishes, in completion order. The processes are forked, so compute
+    and initializer see this process's state (configuration, loaded arrays)
+    and only event IDs and signals are pickled. initializer() runs once in
+    every process, e.g. to build the Garfield objects up front. skip is as
+    for Master. The Profile timers and counters of the processes come back
+    with their results and are added to this process's.
+    processes = None uses every available core, 1 runs the batches here.
+    No more processes are started than there are events.
+    '''
+    todo = np.ascontiguousarray(todo, dtype=np.int64)
+    processes = max(1, min(processes or Cores(), len(todo)))
+    n_events = len(todo)
+
+    next_event = 0
+    n_done = 0
+
+    def next_batch():
+        nonlocal next_event
+        n = ChunkSize(n_events-next_event, processes, chunk_policy, chunk_size, chunk_min)
+        events, next_event, n_skipped = Take(todo, next_event, n, skip)
+        return events
+
+    def finish(events, signals):
+        nonlocal n_done
+        with profile.Timer("collect"):
+            collect(events, signals)
+        if (n_done + len(events))//report > n_done//report or n_done == 0:
+            print(f"{n_done + len(events)} of {n_events} events complete")
+        n_done += len(events)
+
+    if processes == 1:
+        if initializer is not None:
+            initializer()
+        while next_event < n_events:
+            events = next_batch()
+            if len(events) > 0:
+                with profile.Timer("compute"):
+                    sigs = compute(events)
+                finish(events, sigs)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork"),
+                                                initializer=functools.partial(_PoolInit, initializer)) as pool:
+        # Two batches per process in flight, so none waits on this one
+        running = {}
+        def submit():
+            events = next_batch()
+            if len(events) > 0:
+                running[pool.submit(_PoolCompute, compute, events)] = events
+
+        while next_event < n_events and len(running) < 2*processes:
+            submit()
+        while running:
+            with profile.Timer("pool_wait"):
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                events = running.pop(future)
+                if next_event < n_events:
+                    submit()
+                sigs, stats = future.result()
+                profile.Merge(stats)
+                finish(events, sigs)
+
+
+class SerialComm:
+    '''
+    Stand-in for MPI.COMM_WORLD when mpi4py is not installed: a single
+    rank, on which the collectives main.py uses return their own input.
+    '''
+
+    def Get_rank(self):
+        return 0
+
+    def Get_size(self):
+        return 1
+
+    def bcast(self, obj, root=0):
+        return obj
+
+    def gather(self, obj, root=0):
+        return [obj]
+
+    def Barrier(self):
+        pass
+
+
+if __name__ == '__main__':
+    quit()
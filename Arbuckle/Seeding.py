@@ -0,0 +1,70 @@
+import numpy as np
+
+# Random numbers keyed on (run seed, event ID) instead of on the order events
+# are run in. Event N draws the same numbers on any rank, for any number of
+# ranks and after a --resume.
+
+# Independent streams drawn for each event
+STREAM_SOURCE = 0    # source position and direction
+STREAM_GARFIELD = 1  # seed of Garfield's generator
+STREAM_TABLE = 2     # diffusion smearing in drift_mode = Table
+STREAM_NOISE = 3     # electronics noise, see Arbuckle/Electronics.py
+STREAM_GAIN = 4      # avalanche gain fluctuations in drift_mode = RKF
+STREAM_CLUSTERS = 1 << 16  # Garfield seeds of the cluster parts of an event (+ part)
+
+_mask32 = np.uint64(0xFFFFFFFF)
+
+
+def _SplitMix64(x):
+    # SplitMix64 finaliser, a bijective mixer on uint64 (wraps mod 2^64)
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _Keys(run_seed, events, stream):
+    events = np.asarray(events, dtype=np.uint64)
+    key = _SplitMix64(np.full(events.shape, run_seed & 0xFFFFFFFFFFFFFFFF, dtype=np.uint64))
+    return _SplitMix64(_SplitMix64(key ^ events) ^ np.uint64(stream))
+
+
+def Uniforms(run_seed, events, ndraw, stream=STREAM_SOURCE):
+    '''
+    (len(events), ndraw) uniform numbers in [0, 1), row i depends only on
+    (run_seed, events[i], stream). Vectorized over events and draws.
+    '''
+    keys = _Keys(run_seed, events, stream)
+    draws = np.arange(ndraw, dtype=np.uint64)
+    x = _SplitMix64(keys[:, None] ^ (draws[None, :] << np.uint64(32)))
+    return (x >> np.uint64(11)) * 2.0**-53
+
+
+def Normals(run_seed, events, ndraw, stream=STREAM_NOISE):
+    '''
+    (len(events), ndraw) standard normal numbers from Uniforms by the
+    Box-Muller transform, row i depends only on (run_seed, events[i], stream)
+    '''
+    half = (ndraw + 1)//2
+    u = Uniforms(run_seed, events, 2*half, stream)
+    r = np.sqrt(-2.0*np.log1p(-u[:, :half]))
+    theta = 2.0*np.pi*u[:, half:]
+    return np.hstack((r*np.cos(theta), r*np.sin(theta)))[:, :ndraw]
+
+
+def GarfieldSeed(run_seed, event, stream=STREAM_GARFIELD):
+    '''
+    Seed for Garfield's generator before running event.
+    Never 0, which would make ROOT seed from the clock.
+    '''
+    key = _Keys(run_seed, [event], stream)[0]
+    return int(key & _mask32) % 0xFFFFFFFF + 1
+
+
+def NewRunSeed():
+    return int(np.random.SeedSequence().generate_state(1)[0])
+
+
+if __name__ == '__main__':
+    quit()
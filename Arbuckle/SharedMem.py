@@ -0,0 +1,64 @@
+import numpy as np
+try:
+    from mpi4py import MPI
+except ImportError:
+    # Single process runs, nothing to share
+    MPI = None
+
+# Node-level shared memory for large read-only arrays (field grid, lookup
+# table). The first rank of each node loads the arrays into MPI-3 shared
+# windows and every other rank on the node maps the same memory, so a node
+# holds one copy however many ranks it runs.
+
+_windows = []
+
+
+def NodeComm(comm):
+    # Ranks that can share memory with this one
+    return comm.Split_type(MPI.COMM_TYPE_SHARED)
+
+
+def SharedArray(node_comm, shape, dtype):
+    '''
+    Array allocated once per node, owned by node rank 0.
+    Collective over node_comm.
+    '''
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape))*dtype.itemsize if node_comm.Get_rank() == 0 else 0
+    win = MPI.Win.Allocate_shared(nbytes, dtype.itemsize, comm=node_comm)
+    _windows.append(win)
+    buf, _ = win.Shared_query(0)
+
+    return np.ndarray(buffer=buf, dtype=dtype, shape=shape)
+
+
+def Share(node_comm, load):
+    '''
+    Call load() on node rank 0 only and return its list of arrays as shared
+    arrays on every rank of the node. Collective over node_comm.
+    With node_comm = None, just return load().
+    '''
+    if node_comm is None:
+        return list(load())
+
+    arrays = load() if node_comm.Get_rank() == 0 else None
+    specs = node_comm.bcast([(a.shape, a.dtype.str) for a in arrays] if arrays is not None else None, root=0)
+    shared = []
+    for i, (shape, dtype) in enumerate(specs):
+        arr = SharedArray(node_comm, shape, dtype)
+        if node_comm.Get_rank() == 0:
+            arr[...] = arrays[i]
+        shared.append(arr)
+    node_comm.Barrier()
+
+    return shared
+
+
+def Free():
+    # Release every shared window, collective over the node
+    while _windows:
+        _windows.pop().Free()
+
+
+if __name__ == '__main__':
+    quit()
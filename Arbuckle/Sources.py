@@ -0,0 +1,142 @@
+import numpy as np
+import Arbuckle.Seeding as seeding
+
+# Alpha source geometries. Each one maps an (n, ndraw) block of uniform
+# numbers to n rows of (x, y, z, dx, dy, dz) [cm] with NumPy, so a whole
+# batch of events is sampled at once. Rows are keyed on event IDs through
+# Arbuckle/Seeding.py: every rank that samples event N gets the same row.
+
+r = 0.149  # detector radius [cm]
+
+_geometries = {}
+
+def Geometry(name, ndraw):
+    '''
+    Register a source geometry drawing ndraw uniforms per event:
+
+    @Geometry("mysource", 4)
+    def MySource(u):
+        ...
+        return np.column_stack((x, y, z, dx, dy, dz))
+    '''
+    def register(fn):
+        _geometries[name.lower()] = (fn, ndraw)
+        return fn
+    return register
+
+
+def Isotropic(u_cos, u_phi):
+    # Unit vectors uniform on the sphere
+    cos_t = 2*u_cos - 1
+    sin_t = np.sqrt(1 - cos_t**2)
+    phi = 2*np.pi * u_phi
+    return sin_t*np.cos(phi), sin_t*np.sin(phi), cos_t
+
+
+@Geometry("plated", 4)
+def Plated(u):
+    # Disk source plated on the bottom of the detector, emitting into a cone facing +z
+    phi_max = 0.45*np.pi
+    z0 = 0.01
+
+    # --- 1. Uniform point on the disk ---
+    rho = r * np.sqrt(u[:,0])
+    angle = 2*np.pi * u[:,1]
+    x = rho * np.cos(angle)
+    y = rho * np.sin(angle)
+    z = np.full(len(u), z0)
+
+    # --- 2. Random direction inside a cone facing +z ---
+    phi = phi_max * u[:,2]     # 0 → phi_max
+    theta = 2*np.pi * u[:,3]
+
+    dx = np.sin(phi) * np.cos(theta)
+    dy = np.sin(phi) * np.sin(theta)
+    dz = np.cos(phi)
+
+    return np.column_stack((x, y, z, dx, dy, dz))
+
+
+@Geometry("collimated", 4)
+def Collimated(u):
+    # Rectangular source on the +y side of the wall, emitting into a cone facing -y
+    x_min = -0.05
+    x_max = 0.05
+    z_min = 0.001
+    z_max = 0.15
+    phi_max = np.pi * 0.125
+
+    # --- 1. Sample uniformly from the rectangle in (x, z) ---
+    x = x_min + (x_max - x_min) * u[:,0]
+    z = z_min + (z_max - z_min) * u[:,1]
+
+    # --- 2. Project onto cylinder: Y = r*sin(arccos(x/r)) = sqrt(r^2 - x^2) >= 0 ---
+    y = r * np.sin(np.arccos(x / r))
+
+    # --- 3. Sample direction inside cone facing -y ---
+    phi = phi_max * u[:,2]           # 0 → phi_max
+    alpha = 2.0 * np.pi * u[:,3]     # azimuth
+
+    dx =  np.sin(phi) * np.cos(alpha)
+    dy = -np.cos(phi)                # axis along -y
+    dz =  np.sin(phi) * np.sin(alpha)
+
+    return np.column_stack((x, y, z, dx, dy, dz))
+
+
+@Geometry("point", 2)
+def Point(u):
+    # Point source at the centre of the plated disk, isotropic into +z
+    x = np.zeros(len(u))
+    y = np.zeros(len(u))
+    z = np.full(len(u), 0.01)
+    dx, dy, dz = Isotropic(0.5 + 0.5*u[:,0], u[:,1])
+
+    return np.column_stack((x, y, z, dx, dy, dz))
+
+
+@Geometry("line", 3)
+def Line(u):
+    # Line source along the detector axis, isotropic
+    z_min = 0.01
+    z_max = 0.15
+
+    x = np.zeros(len(u))
+    y = np.zeros(len(u))
+    z = z_min + (z_max - z_min) * u[:,0]
+    dx, dy, dz = Isotropic(u[:,1], u[:,2])
+
+    return np.column_stack((x, y, z, dx, dy, dz))
+
+
+@Geometry("volume", 5)
+def Volume(u):
+    # Source spread uniformly through the gas volume, isotropic
+    z_min = 0.001
+    z_max = 0.15
+
+    rho = r * np.sqrt(u[:,0])
+    angle = 2*np.pi * u[:,1]
+    x = rho * np.cos(angle)
+    y = rho * np.sin(angle)
+    z = z_min + (z_max - z_min) * u[:,2]
+    dx, dy, dz = Isotropic(u[:,3], u[:,4])
+
+    return np.column_stack((x, y, z, dx, dy, dz))
+
+
+def Sample(src_type, seed, events):
+    '''
+    (len(events), 6) array of (x, y, z, dx, dy, dz), row i for events[i]
+    '''
+    try:
+        fn, ndraw = _geometries[src_type.lower()]
+    except KeyError:
+        raise Exception("Invalid Source Type. Select from: " +
+                        ",".join(f"\"{name.capitalize()}\"" for name in _geometries) + ".")
+
+    return fn(seeding.Uniforms(seed, events, ndraw, seeding.STREAM_SOURCE))
+
+
+if __name__ == '__main__':
+    quit()
@@ -0,0 +1,158 @@
+import os
+import json
+import hashlib
+import numpy as np
+import Arbuckle.Seeding as seeding
+import Arbuckle.FieldGrid as fieldgrid
+
+# Signal-response lookup table for drift_mode = Table.
+#
+# For drift without significant gain, the current induced by an electron is
+# set by where it starts. The table holds, on a regular grid over the gas
+# volume, the mean induced current of a single electron released at t = 0
+# and the mean and spread of its drift time. An event is then the sum over
+# its clusters of n * (interpolated template), shifted by the cluster time,
+# instead of drifting every cluster with AvalancheMC.
+#
+# Templates are built by Factories.TablePoints and cached under Cache/,
+# keyed by the gas and COMSOL file hashes as well as the settings, so a
+# regenerated gas table or field map never reuses stale templates.
+# Clusters outside the grid get no signal.
+
+# Bounding box of the gas volume (xmin, ymin, zmin, xmax, ymax, zmax) [cm]
+AREA = (-0.15, -0.15, 0.0, 0.15, 0.15, 0.30)
+# Grid spacing [cm]
+SPACING = {"Coarse":0.03,"Normal":0.02,"Fine":0.01}
+
+CACHE_DIR = "Cache"
+
+
+def Axes(detail):
+    # Grid coordinates along x, y, z
+    h = SPACING[detail]
+    return [np.linspace(AREA[i], AREA[i+3], int(round((AREA[i+3]-AREA[i])/h))+1)
+            for i in range(3)]
+
+
+# Cache paths already hashed in this process, by their inputs
+paths = {}
+
+
+def CachePath(inputs):
+    '''
+    inputs = [Gas File, Voltage, Fidelity, tmax, Samples per Point, Field Map,
+              Scaled Table (optional)]
+    Scaled Table = (gas file, pressure [Torr]) loaded in place of Gas File
+    '''
+    name = json.dumps(inputs, sort_keys=True)
+    if name in paths:
+        return paths[name]
+    scaled = inputs[6] if len(inputs) > 6 else None
+    gas = "Gasfiles/" + (scaled[0] if scaled is not None else inputs[0])
+    files = [gas] + fieldgrid.ComsolFiles(inputs[1])
+    key = json.dumps({"gasfile": inputs[0], "voltage": inputs[1], "detail": inputs[2],
+                      "tmax": inputs[3], "samples": inputs[4], "field_map": str(inputs[5]).lower(),
+                      "scaled": scaled, "area": AREA, "spacing": SPACING[inputs[2]],
+                      "files": {fn: fieldgrid.FileHash(fn) for fn in files}}, sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    paths[name] = os.path.join(CACHE_DIR, f"table_{digest}.npz")
+    return paths[name]
+
+
+def Save(path, axes, rows, bin_width):
+    '''
+    rows = (n_points, nbin+2): template, mean drift time, drift time spread
+    for every grid point in C order over (x, y, z)
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shape = tuple(len(a) for a in axes)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp,
+             x=axes[0], y=axes[1], z=axes[2],
+             templates=rows[:, :-2].reshape(shape + (-1,)).astype(np.float32),
+             t_mean=rows[:, -2].reshape(shape),
+             t_std=rows[:, -1].reshape(shape),
+             bin_width=bin_width)
+    os.replace(tmp, path)
+
+
+# Arrays of a saved table, in the order Load returns them
+FIELDS = ("x", "y", "z", "templates", "t_mean", "t_std", "bin_width")
+
+
+def Load(path):
+    data = np.load(path)
+    return [data[name] for name in FIELDS]
+
+
+class Table:
+    '''
+    arrays = list from Load, possibly in node-shared memory (Arbuckle.SharedMem)
+    '''
+
+    def __init__(self, arrays):
+        data = dict(zip(FIELDS, arrays))
+        self.axes = [data["x"], data["y"], data["z"]]
+        self.origin = np.array([a[0] for a in self.axes])
+        self.step = np.array([a[1]-a[0] for a in self.axes])
+        self.shape = np.array([len(a) for a in self.axes])
+        self.templates = data["templates"]
+        self.t_mean = data["t_mean"]
+        self.t_std = data["t_std"]
+        self.bin_width = float(data["bin_width"])
+        self.nbin = self.templates.shape[-1]
+
+    def Corners(self, pos):
+        # Trilinear interpolation: lower corner index and weights of the 8 corners.
+        # Points outside the grid get zero weight, not the edge templates
+        f = (pos - self.origin)/self.step
+        inside = np.all((f >= 0) & (f <= self.shape-1), axis=1)
+        i = np.clip(np.floor(f).astype(int), 0, self.shape-2)
+        f = np.clip(f - i, 0.0, 1.0)
+        corners = []
+        for c in range(8):
+            o = np.array([(c >> 2) & 1, (c >> 1) & 1, c & 1])
+            w = np.prod(np.where(o, f, 1.0-f), axis=1)*inside
+            corners.append((i + o, w))
+        return corners
+
+    def Interpolate(self, pos, grid):
+        # grid values at the points pos (n, 3), grid may carry trailing axes
+        out = 0.0
+        for idx, w in self.Corners(pos):
+            val = grid[idx[:,0], idx[:,1], idx[:,2]]
+            out = out + w.reshape((-1,) + (1,)*(val.ndim-1)) * val
+        return out
+
+    def Synthesize(self, x, y, z, t, n, seed=0, event=0, smear=True):
+        '''
+        Signal of clusters at (x, y, z) [cm], times t [ns], with n electrons.
+        With smear, each cluster's arrival is jittered by the drift-time
+        spread of its start point divided by sqrt(n).
+        '''
+        pos = np.column_stack((x, y, z))
+        n = np.asarray(n, dtype=float)
+        tmpl = self.Interpolate(pos, self.templates) * n[:, None]
+
+        shift = np.asarray(t, dtype=float)
+        if smear:
+            u = seeding.Uniforms(seed, [event], 2*len(n), seeding.STREAM_TABLE)[0]
+            normal = np.sqrt(-2*np.log(1.0 - u[0::2])) * np.cos(2*np.pi*u[1::2])
+            shift = shift + normal * self.Interpolate(pos, self.t_std)/np.sqrt(np.maximum(n, 1))
+
+        # Shift every template by a fractional number of bins, splitting it
+        # between the two neighbouring integer shifts
+        s = shift/self.bin_width
+        k = np.floor(s).astype(int)
+        frac = (s - k)[:, None]
+        cols = np.arange(self.nbin)[None, :] + k[:, None]
+        sig = np.zeros(self.nbin)
+        for c, part in ((cols, (1.0-frac)*tmpl), (cols+1, frac*tmpl)):
+            keep = (c >= 0) & (c < self.nbin)
+            sig += np.bincount(c[keep], weights=part[keep], minlength=self.nbin)
+
+        return sig
+
+
+if __name__ == '__main__':
+    quit()
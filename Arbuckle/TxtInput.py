@@ -12,6 +12,17 @@ def parse_value(v: str):
     if v.lower() == "false":
         return False
 
+    # Lists: a, b, c
+    if "," in v:
+        return [parse_value(x) for x in v.split(",") if x.strip()]
+
+    # Ranges: start:stop:step, stop included
+    if v.count(":") == 2:
+        start, stop, step = (parse_value(x) for x in v.split(":"))
+        if all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in (start, stop, step)) and step > 0:
+            n = int(round((stop - start)/step))
+            return [start + i*step for i in range(n+1)]
+
     # Numbers (int or float)
     try:
         if "." in v or "e" in v.lower():
@@ -48,6 +59,36 @@ def load_config(filename="config.txt"):
     return config
 
 
+def load_manifest(filename="batch.txt"):
+    """
+    Batch manifest: one input file per line, optionally followed by
+    overrides of its keys separated by ";", e.g.
+        Input.txt
+        Input.txt; drift_mode = Table; src_type = Point
+    Returns one configuration per line.
+    """
+    configs = []
+
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+
+            # Skip blank lines or comments
+            if not line or line.startswith("#"):
+                continue
+
+            parts = line.split(";")
+            config = load_config(parts[0].strip())
+            for part in parts[1:]:
+                if "=" not in part:
+                    continue
+                key, value = part.split("=", 1)
+                config[key.strip()] = parse_value(value)
+            configs.append(config)
+
+    return configs
+
+
 # Example usage
 if __name__ == "__main__":
     import sys
@@ -1,228 +1,693 @@
 import sys
 import os
+import json
+import time
+T_START = time.perf_counter()
 import ROOT
 import Garfield # pyright: ignore[reportMissingImports]
 import Gasfiles.genGasfile
+import Gasfiles.gasLibrary
 import Arbuckle.Factories as f
-from Arbuckle.TxtInput import load_config
-from mpi4py import MPI
+import Arbuckle.Scheduler as sched
+import Arbuckle.Seeding as seeding
+import Arbuckle.Sources as sources
+import Arbuckle.Table as table
+import Arbuckle.FieldGrid as fieldgrid
+import Arbuckle.ComsolCache as comsolcache
+import Arbuckle.SharedMem as sharedmem
+import Arbuckle.Profile as profile
+import Arbuckle.Features as features
+import Arbuckle.Electronics as electronics
+import Arbuckle.Convergence as convergence
+import Arbuckle.Plots as plots
+from Arbuckle.ObjectCache import ObjectCache
+from Arbuckle.EventStore import EventStore, Manifest
+from Arbuckle.TxtInput import load_config, load_manifest
 import numpy as np
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+T_IMPORT = time.perf_counter()
 
-comm = MPI.COMM_WORLD
+comm = MPI.COMM_WORLD if MPI is not None else sched.SerialComm()
 rank, size = comm.Get_rank(), comm.Get_size()
 
+# A single process runs its events on a local pool of processes instead,
+# see Scheduler.Pool. Without an MPI launcher (or without mpi4py) the pool
+# uses every core; under mpirun -np 1 it is opt-in (local_processes)
+local = size == 1
+launched = sched.Launched()
+
+def Finalize():
+    if MPI is not None:
+        MPI.Finalize()
+
 if rank > 1:
     devnull = os.open(os.devnull, os.O_WRONLY)
     os.dup2(devnull, 1)  # stdout
     os.dup2(devnull, 2)  # stderr
 
+# Command line flags
+resume = "--resume" in sys.argv[1:]
+batch = "--batch" in sys.argv[1:]
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+
 if rank == 0:
     # Look for input file on Master
     try:
-        filename = sys.argv[1]
+        filename = args[0]
         exit_status = False
     except:
         print("No Input File Given")
-        print("Use: python test.py input.txt")
+        print("Use: python test.py [--resume] [--batch] input.txt")
         exit_status = True
 else:
     exit_status = None
 exit_status = comm.bcast(exit_status, root=0)
-if exit_status:    
+if exit_status:
     # Exit on all workers
-    MPI.Finalize()
+    Finalize()
     sys.exit()
 
+def Voltages(cfg):
+    # voltage may be a list (or start:stop:step) for a sweep
+    return cfg["voltage"] if isinstance(cfg["voltage"], list) else [cfg["voltage"]]
+
+def ConfigName(name, ci, c, voltage):
+    # Output name of configuration ci at voltage: name_<configuration> in a
+    # batch and name_<V>V in a voltage sweep, e.g. signal.npy -> signal_2_200V.npy
+    root, ext = os.path.splitext(name)
+    if batch:
+        root += f"_{ci}"
+    if isinstance(c["voltage"], list):
+        root += f"_{voltage}V"
+    return root + ext
+
+def LocalProcesses(c):
+    # Size of the local pool, None uses every available core, or runs
+    # serially when started by an MPI launcher
+    return c.get("local_processes") or (1 if launched else sched.Cores())
+
+def Prepare(cfg, ci):
+    # Field caches and seed of configuration ci, on the Master
+    voltages = Voltages(cfg)
+    if cfg.get("field_map", "Mesh").lower() == "grid":
+        # Sample the COMSOL field map onto a regular grid once per voltage, keyed by file hashes
+        cfg["field_cache"] = [fieldgrid.CachePath(v, cfg["sim_detail"]) for v in voltages]
+        for v, path in zip(voltages, cfg["field_cache"]):
+            if not fieldgrid.Exists(path):
+                print(f"Building field grid cache: {path}")
+                f.BuildFieldGrid([v,
+                                  cfg["sim_detail"],
+                                  path], f.Medium([cfg["gasfile"],
+                                                   cfg["ionfile"],
+                                                   cfg.get("gas_scaled")]))
+    elif cfg["cmp_type"] == "COMSOL" and cfg.get("comsol_cache", True):
+        # Parse the COMSOL text files once into a binary cache, keyed by file hashes.
+        # The mesh is shared by every voltage, each voltage adds its potential
+        cfg["comsol_cache_dir"] = comsolcache.CachePath(voltages[0])
+        for v in voltages:
+            if cfg["comsol_cache_dir"] is not None and not comsolcache.Exists(cfg["comsol_cache_dir"], v):
+                print(f"Building COMSOL cache: {cfg['comsol_cache_dir']} ({v} V)")
+                if not f.BuildComsolCache([v,
+                                           cfg["comsol_cache_dir"]], f.Medium([cfg["gasfile"],
+                                                                               cfg["ionfile"],
+                                                                               cfg.get("gas_scaled")])):
+                    cfg["comsol_cache_dir"] = None
+    if cfg.get("seed") is None and resume:
+        # A resumed run keeps the seed its event store was started with
+        manifest = Manifest("Outputs/"+ConfigName(cfg["f_event_store"], ci, cfg, voltages[0]))
+        if manifest is not None:
+            cfg["seed"] = manifest["info"].get("seed")
+    if cfg.get("seed") is None:
+        cfg["seed"] = seeding.NewRunSeed()
+        print(f"Run seed: {cfg['seed']}")
+
+    return cfg
+
 if rank == 0:
-    cfg = load_config(filename=filename)
-    if not Gasfiles.genGasfile.FileExists(cfg["gasfile"]):
-        Gasfiles.genGasfile.GenerateGasFile(cfg["gasfile"])
-else: 
-    cfg = None
-# Broadcast configuration to each worker
-cfg = comm.bcast(cfg,root=0)
-
-## Set up Garfield Objects on each Worker
-## if size is == 1 build on Master
-gas = None
-cmp = None
-sens = None
-vd = None
-vm = None
-track = None
-drift = None
-if size == 1 or rank != 0:
-    if rank <= cfg["n_events"]:
-        gas = f.Medium([cfg["gasfile"],
-                        cfg["ionfile"]])
-        cmp = f.Component([cfg["cmp_type"],
-                        cfg["voltage"]], gas)
-        sens = f.Sensor([cfg["tmax"],
-                        cfg["sim_detail"]], cmp)
-        vd = ROOT.Garfield.ViewDrift()
-        track = f.Track([cfg["srimfile"],
-                        cfg["trackE"],
-                        cfg["sim_detail"],
-                        cfg["straggle"]], sens, vd)
-        drift = f.Drift([cfg["drift_mode"],
-                        cfg["sim_detail"]], sens, vd)
-
-# pre-compute plots should only happen for the first worker
-# plot electron ion drift velocities from gas data
-canvases = []
-if (size > 1 and rank == 1) or (size == 1 and rank == 0):
-    if cfg["plot_e_vel"]:
-        c1 = ROOT.TCanvas("c1","",600,600)
-        gas.PlotVelocity("e",c1)
-        canvases.append(c1)
-
-    if cfg["plot_ion_vel"]:
-        c2 = ROOT.TCanvas("c2","",600,600)
-        gas.PlotVelocity("i",c2)
-        canvases.append(c2)
-
-    if cfg["plot_mesh"]:
-        vm = ROOT.Garfield.ViewFEMesh()
-        vm.SetComponent(cmp)
-        vm.SetPlane(0,-1,0,0,0,0)
-        vm.SetFillMesh(True)
-        vm.SetArea(-0.5, -0.5, -0.5, 0.5, 0.5, 0.5)
-        vm.Plot()
-
-
-    if cfg["plot_field"]:
-        c3 = ROOT.TCanvas("c3","",600,600)
-        vf = ROOT.Garfield.ViewField()
-        vf.SetComponent(cmp)
-        # Set the normal vector of the viewing plane (xz plane).
-        vf.SetPlane(-1,0,0,0,0,0)
-        # Set the plot limits in the current viewing plane.
-        vf.SetArea(-.23,-.23, -0.04,.23,.23,0.34)
-        vf.SetVoltageRange(-cfg["voltage"], 0.)
-        c3.SetLeftMargin(0.16)
-        vf.SetCanvas(c3)
-        vf.PlotContour()
-
-if size > 1 and rank == 0:
-    n_wkrs = size-1
-    n_events = cfg["n_events"]
-    n_jobs_sent = 0
-    n_active_wkrs = 0 
-    avg_sig = 0
-    one_sig = 0
-    hist = []
-    
-
-    for rnk in range(1,size):
-        if rnk <= n_events:
-            comm.isend(1, dest=rnk, tag=1) #True -> compute tag = 1
-            n_active_wkrs += 1
-        if rnk > n_events:
-            comm.isend(0, dest=rnk, tag=0) #False -> brake  tag =0
-
-    while n_active_wkrs > 0:
-        # Non-blocking probe for incoming messages
-        if comm.Iprobe(source=MPI.ANY_SOURCE, tag=2):
-            data = comm.recv(source=MPI.ANY_SOURCE, tag=2)  # tag = 2  {"data":[],"worker:rank"}
-            worker = data["worker"]
-
-            if n_jobs_sent % 50 == 0:
-                print(f"{n_jobs_sent} of {n_events} events complete")
-
-            if n_jobs_sent < n_events:
-                if n_jobs_sent == n_events-1:
-                    comm.isend(11,dest=worker,tag=1) # produce post computation plots for last send
-                else:
-                    comm.isend(1,dest=worker,tag=1)   
-                n_jobs_sent += 1
-            else:
-                comm.isend(0,dest=worker,tag=0)
-                n_active_wkrs -= 1
-            
-            data_a = np.array(data["data"])
-            if type(one_sig) != np.ndarray:
-                one_sig += data_a
-            avg_sig += data_a/n_events
-            hist.append(sum(data_a))
-    
-    if cfg["f_timed_signal"] is not None:
-        np.save("Outputs/"+cfg["f_timed_signal"],one_sig)
-
-    if cfg["f_charge_hist"] is not None:
-        np.save("Outputs/"+cfg["f_charge_hist"],np.array(hist))
-    
-    if cfg["f_avg_timed_signal"] is not None:
-        np.save("Outputs/"+cfg["f_avg_timed_signal"],np.array(avg_sig))
-
-elif rank != 0:
-    while True:
-        work = comm.recv(source=0,tag=MPI.ANY_TAG)
-
-        if work:
-            sig = 0
-            vd.Clear()
-            sig = f.Compute([cfg["drift_mode"],
-                             cfg["src_type"]], sens, track, drift)
-            if work == 11:
-                if cfg["plot_signal"]:
-                    c4 = ROOT.TCanvas("c4","",600,600)
-                    sens.PlotSignal("W",c4)
-                    canvases.append(c4)
-
-                if cfg["plot_drift"]:
-                    c5 = ROOT.TCanvas("c5","",600,600)
-                    vd.SetPlane(-1,0,0,0,0,0)
-                    vd.SetArea(-.23,-.23, -0.04,.23,.23,0.34)
-                    vd.SetCanvas(c5)
-                    vd.Plot(True)
-                    canvases.append(c5)
-            
-            comm.isend({"data":sig,"worker":rank},dest=0,tag=2)
+    # A batch manifest lists several input files, see TxtInput.load_manifest
+    cfgs = load_manifest(filename) if batch else [load_config(filename=filename)]
+    if resume and any(cfg.get("f_event_store") is None for cfg in cfgs):
+        print("--resume continues from the event store, set f_event_store in the input file")
+        cfgs = None
+    missing = []
+    for c in cfgs or []:
+        if Gasfiles.genGasfile.FileExists(c["gasfile"]) or c["gasfile"] in missing:
+            continue
+        # A table of the same gas at a nearby density is rescaled instead of generated
+        c["gas_scaled"] = Gasfiles.gasLibrary.Resolve(c["gasfile"], c.get("gas_tolerance", 0.05))
+        if c["gas_scaled"] is not None:
+            print(f"{c['gasfile']}: using {c['gas_scaled'][0]} at {c['gas_scaled'][1]:.6g} Torr")
         else:
-            break
+            Gasfiles.gasLibrary.Report(c["gasfile"])
+            missing.append(c["gasfile"])
 else:
-    avg_sig = 0
-    one_sig = 0
-    hist = []
-    n_events = cfg["n_events"]
-    
-    for i in range(n_events):
-        vd.Clear()
-        data_a = np.array(f.Compute([cfg["drift_mode"],
-                             cfg["src_type"]], sens, track, drift))
-        if type(one_sig) != np.ndarray:
-            one_sig += data_a
-        avg_sig += data_a/n_events
-        hist.append(sum(data_a))
-        if i % 50 == 0:
-            print(f"{i} of {n_events} events complete")
-    
-    if cfg["plot_signal"]:
-        c4 = ROOT.TCanvas("c4","",600,600)
-        sens.PlotSignal("W",c4)
-        canvases.append(c4)
-
-    if cfg["plot_drift"]:
-        c5 = ROOT.TCanvas("c5","",600,600)
-        vd.SetPlane(-1,0,0,0,0,0)
-        vd.SetArea(-.23,-.23, -0.04,.23,.23,0.34)
-        vd.SetCanvas(c5)
-        vd.Plot(True)
-        canvases.append(c5)
-
-    if cfg["f_timed_signal"] is not None:
-        np.save("Outputs/"+cfg["f_timed_signal"],one_sig)
-
-    if cfg["f_charge_hist"] is not None:
-        np.save("Outputs/"+cfg["f_charge_hist"],np.array(hist))
-
-    if cfg["f_avg_timed_signal"] is not None:
-        np.save("Outputs/"+cfg["f_avg_timed_signal"],np.array(avg_sig))
+    missing = None
+# Missing gas files are generated by every rank, split by field point
+missing = comm.bcast(missing, root=0)
+t_gas = time.perf_counter()
+if missing and local:
+    Gasfiles.genGasfile.GenerateGasFiles(missing, processes=LocalProcesses(cfgs[0]))
+elif missing:
+    Gasfiles.genGasfile.GenerateGasFiles(missing, comm)
+t_gas = time.perf_counter() - t_gas
+if rank == 0:
+    if cfgs is not None:
+        cfgs = [Prepare(cfg, ci) for ci, cfg in enumerate(cfgs)]
+else:
+    cfgs = None
+# Broadcast configurations to each worker
+cfgs = comm.bcast(cfgs,root=0)
+if cfgs is None:
+    Finalize()
+    sys.exit()
+# Parallel settings and plots come from the first configuration
+cfg = cfgs[0]
+
+## Per-phase timers and counters of every rank, see Arbuckle/Profile.py.
+## Phases before this point are timed by hand
+profile.Enable(cfg.get("f_profile") is not None)
+profile.Add("import", T_IMPORT - T_START)
+profile.Add("gas_generation", t_gas)
+profile.Add("setup", time.perf_counter() - T_IMPORT - t_gas)
+
+## Work items: every (configuration, voltage) pair is a job, and every event
+## of every job is one work item. Items are numbered job after job, so the
+## whole batch is a single queue and no rank idles until it is done.
+## An event has the same source and random numbers at every voltage.
+## With cluster_parts > 1 an event is split into that many items, each
+## drifting a share of the track's clusters, summed again on the Master.
+def Parts(c):
+    # Work items per event, Table mode is fast enough to run whole
+    if c["drift_mode"].lower() == "table":
+        return 1
+    return max(1, int(c.get("cluster_parts", 1)))
+
+jobs = [(ci, vi) for ci in range(len(cfgs)) for vi in range(len(Voltages(cfgs[ci])))]
+job_parts = np.array([Parts(cfgs[ci]) for ci, vi in jobs], dtype=np.int64)
+offsets = np.concatenate(([0], np.cumsum([cfgs[ci]["n_events"]*Parts(cfgs[ci]) for ci, vi in jobs]))).astype(np.int64)
+n_items = int(offsets[-1])
+
+def Jobs(items):
+    # job index, event number and cluster part of each work item
+    js = np.searchsorted(offsets, items, side="right") - 1
+    events, parts = np.divmod(items - offsets[js], job_parts[js])
+    return js, events, parts
+
+# Electronics response of each configuration (shaping, noise, ADC), None if off.
+# Signals are computed on raw_nbins bins and leave the response on nbins bins
+raw_nbins = [f.NBins(c["tmax"], c["sim_detail"]) for c in cfgs]
+chains = [electronics.FromConfig(c, raw_nbins[ci], f.wbin[c["sim_detail"]]) for ci, c in enumerate(cfgs)]
+nbins = [chain.nbin_out if chain is not None else raw_nbins[ci] for ci, chain in enumerate(chains)]
+
+def BinWidth(ci):
+    # Bin width [ns] of the output signals of configuration ci
+    return chains[ci].period if chains[ci] is not None else f.wbin[cfgs[ci]["sim_detail"]]
+
+def Width(j):
+    # Signal bins sent for job j: split events are sent raw and get the
+    # electronics response on the Master once their parts are summed
+    ci = jobs[j][0]
+    return raw_nbins[ci] if job_parts[j] > 1 else nbins[ci]
+
+def Response(j, sigs, events):
+    ci = jobs[j][0]
+    if chains[ci] is None:
+        return sigs
+    return chains[ci].Apply(sigs, cfgs[ci]["seed"], events)
+
+# Signals are padded to the longest in the batch
+nbin = max(Width(j) for j in range(len(jobs)))
+
+## Large read-only arrays (field grid, lookup table) are held once per node
+## in shared memory when running with several processes
+node_comm = None
+if size > 1 and cfg.get("shared_memory", True):
+    node_comm = sharedmem.NodeComm(comm)
+
+grids = {}
+for c in cfgs:
+    if c.get("field_cache") is not None and c["field_cache"][0] not in grids:
+        path = c["field_cache"][0]
+        grids[path] = sharedmem.Share(node_comm, lambda: fieldgrid.Load(path))
+
+## Garfield Objects are built on each Worker when first needed and kept in an
+## LRU cache keyed by the input values they are built from.
+## The Master builds them as well when it computes its own share of events
+master_compute = size == 1 or cfg.get("master_compute", True)
+computing = rank != 0 or master_compute
+
+# Input keys that decide how the Garfield objects are built
+OBJECT_KEYS = ("gasfile", "gas_scaled", "ionfile", "cmp_type", "field_map", "comsol_cache_dir",
+               "tmax", "sim_detail", "srimfile", "trackE", "straggle", "drift_mode")
+
+def ObjectKey(c):
+    return tuple(str(c.get(key)) for key in OBJECT_KEYS)
+
+def Objects(c):
+    # Garfield objects of a configuration, built at its first voltage
+    with profile.Timer("gas_load"):
+        gas = f.Medium([c["gasfile"],
+                        c["ionfile"],
+                        c.get("gas_scaled")])
+    with profile.Timer("component_load"):
+        comsol_blocks = None
+        if c.get("comsol_cache_dir") is not None:
+            comsol_blocks = comsolcache.Load(c["comsol_cache_dir"], Voltages(c)[0])
+        grid_arrays = None
+        if c.get("field_cache") is not None:
+            grid_arrays = grids[c["field_cache"][0]]
+        cmp = f.Component([c["cmp_type"],
+                        Voltages(c)[0],
+                        grid_arrays,
+                        comsol_blocks], gas)
+    sens = f.Sensor([c["tmax"],
+                    c["sim_detail"]], cmp)
+    track = f.Track([c["srimfile"],
+                    c["trackE"],
+                    c["sim_detail"],
+                    c["straggle"]], sens)
+    drift = f.Drift([c["drift_mode"],
+                    c["sim_detail"]], sens)
+
+    return {"gas": gas, "cmp": cmp, "sens": sens, "track": track,
+            "drift": drift, "voltage": Voltages(c)[0]}
+
+# objects used by the plots stay intact when evicted
+plot_obj = None
+
+def Release(obj):
+    if obj is not plot_obj:
+        f.Release(obj["cmp"])
+
+objects = ObjectCache(cfg.get("object_cache", 4), cfg.get("object_cache_min_free_mb", 1024), Release)
+
+def UseObjects(c, voltage):
+    # Objects of configuration c holding the potential of voltage.
+    # Only the potential is swapped, the mesh and weighting potential stay
+    obj = objects.Get(ObjectKey(c), lambda: Objects(c))
+    if obj["voltage"] != voltage:
+        profile.Count("voltage_swaps")
+        vi = Voltages(c).index(voltage)
+        field = None
+        if c.get("field_cache") is not None:
+            field = fieldgrid.Load(c["field_cache"][vi])[1]
+        pot = None
+        if c.get("comsol_cache_dir") is not None:
+            pot = comsolcache.LoadPotential(c["comsol_cache_dir"], voltage)
+        f.SetVoltage([voltage, field, pot], obj["cmp"], obj["gas"])
+        obj["voltage"] = voltage
+    return obj
+
+def Warm():
+    # Build the objects of the first job once in every local pool process
+    ci, vi = jobs[0]
+    UseObjects(cfgs[ci], Voltages(cfgs[ci])[vi])
+
+def Run(run_comm, todo, width, compute, collect, initializer=None, **kwargs):
+    # Hand out work items to the ranks of run_comm, or to the local pool
+    # when running alone. Results reach collect the same way from both
+    if local:
+        sched.Pool(todo, width, compute, collect, processes=LocalProcesses(cfg),
+                   initializer=initializer, **kwargs)
+    else:
+        sched.Master(run_comm, todo, width, compute, collect, master_compute=master_compute, **kwargs)
+
+def TablePath(c, voltage):
+    return table.CachePath([c["gasfile"],
+                            voltage,
+                            c["sim_detail"],
+                            c["tmax"],
+                            c.get("table_samples", 20),
+                            c.get("field_map", "Mesh"),
+                            c.get("gas_scaled")])
+
+## Lookup tables for drift_mode = Table
+## built once per (gas, voltage, fidelity) across all ranks, then cached
+lookups = {}
+for ci, vi in jobs:
+    c = cfgs[ci]
+    voltage = Voltages(c)[vi]
+    if c["drift_mode"].lower() != "table":
+        continue
+    table_path = TablePath(c, voltage)
+    if table_path in lookups:
+        continue
+    build = comm.bcast(not os.path.exists(table_path) if rank == 0 else None, root=0)
+    t_table = time.perf_counter()
+    if build:
+        # Only ranks computing events (and the Master) take part
+        build_comm = comm if local else comm.Split(0 if rank == 0 or computing else MPI.UNDEFINED, rank)
+        if local or build_comm != MPI.COMM_NULL:
+            axes = table.Axes(c["sim_detail"])
+            n_points = int(np.prod([len(a) for a in axes]))
+            table_nbin = raw_nbins[ci]
+
+            def TablePoints(points):
+                obj = UseObjects(c, voltage)
+                return f.TablePoints([c["sim_detail"], c.get("table_samples", 20)],
+                                     obj["sens"], obj["drift"], points)
+
+            if rank == 0:
+                print(f"Building lookup table of {n_points} points: {table_path}")
+                rows = np.zeros((n_points, table_nbin+2))
+                def StoreRows(points, data):
+                    rows[points] = data
+                Run(build_comm, np.arange(n_points), table_nbin+2, TablePoints, StoreRows,
+                    report=max(1, n_points//10))
+                table.Save(table_path, axes, rows, f.wbin[c["sim_detail"]])
+            else:
+                sched.Worker(build_comm, TablePoints)
+            if not local:
+                build_comm.Free()
+    comm.Barrier()
+    lookups[table_path] = table.Table(sharedmem.Share(node_comm, lambda: table.Load(table_path)))
+    profile.Add("table_build", time.perf_counter() - t_table)
+
+## Workers reduce every event to its pulse features (Arbuckle/Features.py)
+## and send its waveform as well only where the Master keeps it: split
+## events (summed on the Master), event stores and every waveform_every-th event
+def Shipped(j, events):
+    # Events of job j whose waveform is sent to the Master
+    c = cfgs[jobs[j][0]]
+    if job_parts[j] > 1 or c.get("f_event_store") is not None:
+        return np.ones(len(events), dtype=bool)
+    every = c.get("waveform_every", 1) or 0
+    if every <= 0:
+        return np.zeros(len(events), dtype=bool)
+    return events % every == 0
+
+def JobFeatures(j, sigs):
+    c = cfgs[jobs[j][0]]
+    return features.Extract(sigs, BinWidth(jobs[j][0]), c.get("feature_threshold"))
+
+def Simulate(j, events, parts, vd=None):
+    # Raw signals of the given events (and parts) of job j. With a ViewDrift vd,
+    # their track and drift lines are recorded in it for the plots
+    ci, vi = jobs[j]
+    c = cfgs[ci]
+    voltage = Voltages(c)[vi]
+    obj = UseObjects(c, voltage)
+    lookup = lookups.get(TablePath(c, voltage)) if c["drift_mode"].lower() == "table" else None
+    srcs = sources.Sample(c["src_type"], c["seed"], events)
+    raw = np.zeros((len(events), raw_nbins[ci]))
+    if vd is not None:
+        f.Plotting(vd, obj["track"], obj["drift"])
+    for k, (src, event, part) in enumerate(zip(srcs, events, parts)):
+        raw[k] = f.Compute([c["drift_mode"],
+                              src,
+                              c["seed"],
+                              event,
+                              c.get("table_smear", True),
+                              part,
+                              job_parts[j],
+                              [c.get("rkf_gain"),
+                               c.get("rkf_polya_theta", 0.5),
+                               c.get("rkf_diffusion", False)]], obj["sens"], obj["track"], obj["drift"], lookup)
+    if vd is not None:
+        f.Plotting(None, obj["track"], obj["drift"])
+    return raw
+
+def Compute(items):
+    sigs = np.zeros((len(items), nbin))
+    js, events, parts = Jobs(items)
+    for j in np.unique(js):
+        sel = np.flatnonzero(js == j)
+        raw = Simulate(j, events[sel], parts[sel])
+        sigs[sel, :Width(j)] = raw if job_parts[j] > 1 else Response(j, raw, events[sel])
+
+    # Features of every event, followed by the waveforms if any event of the batch ships its own
+    feats = np.zeros((len(items), features.N_FEATURES))
+    ship = False
+    for j in np.unique(js):
+        sel = js == j
+        feats[sel] = JobFeatures(j, sigs[sel, :Width(j)])
+        ship = ship or Shipped(j, events[sel]).any()
+
+    return np.hstack((feats, sigs)) if ship else feats
+
+# Input keys that may change between a run and its --resume
+RESUME_IGNORE = ("f_", "plot_", "chunk_", "master_compute", "checkpoint_every",
+                 "shared_memory", "comsol_cache", "object_cache", "local_processes",
+                 "waveform_every", "feature_threshold", "converge_")
+
+def JobName(name, j):
+    # Output name of one job, see ConfigName
+    ci, vi = jobs[j]
+    return ConfigName(name, ci, cfgs[ci], Voltages(cfgs[ci])[vi])
+
+def JobConfig(j):
+    # Configuration of one job, as recorded in its event store
+    ci, vi = jobs[j]
+    jcfg = dict(cfgs[ci], voltage=Voltages(cfgs[ci])[vi])
+    if jcfg.get("field_cache") is not None:
+        jcfg["field_cache"] = jcfg["field_cache"][vi]
+    return jcfg
 
 if rank == 0:
-    if cfg["plot_e_vel"] or cfg["plot_ion_vel"] or cfg["plot_field"] or cfg["plot_mesh"] or cfg["plot_drift"] or cfg["plot_signal"]:
-        input("Press any key to end\n")
+    avg_sig = [np.zeros(nbins[ci]) for ci, vi in jobs]
+    n_avg = [0]*len(jobs)
+    # Waveform of the lowest event shipped, as from an event store, so the
+    # saved signal does not depend on which batch arrives first
+    one_sig = [0]*len(jobs)
+    one_event = [None]*len(jobs)
+    hist = [[] for j in jobs]
+    feature_rows = [[] for j in jobs]
+
+    # Adaptive stopping: a job whose statistics have converged gets no more
+    # events handed out, see Arbuckle/Convergence.py
+    monitors = [convergence.FromConfig(cfgs[ci]) for ci, vi in jobs]
+    stopped = np.zeros(len(jobs), dtype=bool)
+
+    # Stream every event to disk as it arrives, each flush is a checkpoint
+    stores = [None]*len(jobs)
+    todo = []
+    n_remaining = 0
+    for j, (ci, vi) in enumerate(jobs):
+        c = cfgs[ci]
+        remaining = np.arange(c["n_events"])
+        if c.get("f_event_store") is not None:
+            stores[j] = EventStore("Outputs/"+JobName(c["f_event_store"], j), c["n_events"], nbins[ci],
+                                   BinWidth(ci), info=JobConfig(j),
+                                   flush_every=c.get("checkpoint_every", 100),
+                                   resume=resume, ignore=RESUME_IGNORE)
+            remaining = stores[j].Remaining()
+            # A job that stopped before keeps its original stop, one that did not
+            # has its events replayed in event order to carry on the checks
+            stop = stores[j].manifest.get("stop")
+            if monitors[j] is not None and stop is not None and monitors[j].Restore(stop) is not None:
+                stopped[j] = True
+            elif monitors[j] is not None and monitors[j].Replay(stores[j].Charges(), stores[j].waveforms,
+                                                                stores[j].Done()) is not None:
+                stopped[j] = True
+        todo.append(offsets[j] + (remaining[:, None]*job_parts[j] + np.arange(job_parts[j])).ravel())
+        n_remaining += len(remaining)
+    todo = np.concatenate(todo)
+    if resume:
+        # todo holds job_parts items per event
+        n_total = sum(cfgs[ci]["n_events"] for ci, vi in jobs)
+        print(f"Resuming: {n_total-n_remaining} of {n_total} events already complete")
+
+    # Parts of split events received so far, by (job, event), and the split
+    # events handed out so far, which still run to the end once their job stops
+    pending = {}
+    started = set()
+
+    def Assemble(j, events, parts, sigs):
+        # Sum the parts of split events in part order, return the events now complete
+        done_events, done_sigs = [], []
+        for event, part, sig in zip(events, parts, sigs):
+            rows = pending.setdefault((j, event), {})
+            rows[part] = sig.copy()
+            if len(rows) == job_parts[j]:
+                done_events.append(event)
+                done_sigs.append(np.sum([rows[p] for p in range(job_parts[j])], axis=0))
+                del pending[(j, event)]
+                started.discard((j, event))
+        return np.array(done_events, dtype=np.int64), np.array(done_sigs).reshape(len(done_events), sigs.shape[1])
+
+    def Converge(j, job_feats, waveforms):
+        if monitors[j] is None or stopped[j]:
+            return
+        if monitors[j].Update(job_feats[:, features.CHARGE], waveforms) is not None:
+            stopped[j] = True
+            if stores[j] is not None:
+                # Checkpointed with the events, so --resume reports this stop
+                stores[j].manifest["stop"] = monitors[j].State()
+                stores[j].Flush()
+            print(f"{JobName('job', j)}: {monitors[j].reason}, finishing the events already running")
+
+    def Skip(items):
+        # Events of stopped jobs are not handed out, apart from the remaining
+        # parts of split events already started. Parts of an event are
+        # consecutive in todo, so an event has started once part 0 is out
+        js, events, parts = Jobs(items)
+        drop = stopped[js].copy()
+        for k in np.flatnonzero(drop & (parts > 0)):
+            drop[k] = (js[k], events[k]) not in started
+        for k in np.flatnonzero(~drop & (parts == 0) & (job_parts[js] > 1)):
+            started.add((js[k], events[k]))
+        return drop
+
+    def Collect(items, rows):
+        # rows are views of the receive buffer, keep copies only.
+        # Each row holds an event's features, then its waveform if the batch has them
+        js, events, parts = Jobs(items)
+        feats, sigs = rows[:, :features.N_FEATURES], rows[:, features.N_FEATURES:]
+        for j in np.unique(js):
+            sel = js == j
+            job_events = events[sel]
+            job_feats = feats[sel]
+            job_sigs = sigs[sel, :Width(j)]
+            if job_parts[j] > 1:
+                job_events, job_sigs = Assemble(j, job_events, parts[sel], job_sigs)
+                if len(job_events) == 0:
+                    continue
+                job_sigs = Response(j, job_sigs, job_events)
+                job_feats = JobFeatures(j, job_sigs)
+            if stores[j] is not None:
+                with profile.Timer("io"):
+                    stores[j].Write(job_events, job_sigs)
+                Converge(j, job_feats, job_sigs)
+                continue
+            feature_rows[j].append((job_events.copy(), job_feats.copy()))
+            hist[j].extend(job_feats[:, features.CHARGE])
+            kept = Shipped(j, job_events) if job_sigs.shape[1] > 0 else np.zeros(len(job_events), dtype=bool)
+            if kept.any():
+                k = np.flatnonzero(kept)[np.argmin(job_events[kept])]
+                if one_event[j] is None or job_events[k] < one_event[j]:
+                    one_event[j] = job_events[k]
+                    one_sig[j] = job_sigs[k].copy()
+                avg_sig[j] += job_sigs[kept].sum(axis=0)
+                n_avg[j] += int(kept.sum())
+            Converge(j, job_feats, job_sigs[kept])
+
+    Run(comm, todo, features.N_FEATURES + nbin, Compute, Collect,
+        initializer=Warm,
+        chunk_policy=cfg.get("chunk_policy", "Guided"),
+        chunk_size=cfg.get("chunk_size", 8),
+        chunk_min=cfg.get("chunk_min", 1),
+        skip=Skip if any(m is not None for m in monitors) else None)
+    if pending:
+        print(f"{len(pending)} split events did not complete and are left out of the outputs")
 
+    t_io = time.perf_counter()
+    for j, (ci, vi) in enumerate(jobs):
+        c = cfgs[ci]
+        if monitors[j] is not None:
+            # Why the job stopped, in the event store and f_convergence
+            n_run = len(stores[j].Done()) if stores[j] is not None else len(hist[j])
+            stop = monitors[j].Report(c["n_events"], n_run)
+            print(f"{JobName('job', j)}: {stop['reason']}")
+            if stores[j] is not None:
+                stores[j].manifest["stop_reason"] = stop["reason"]
+            if c.get("f_convergence") is not None:
+                with open("Outputs/"+JobName(c["f_convergence"], j), "w") as fh:
+                    json.dump(stop, fh, indent=2)
+
+        if stores[j] is not None:
+            # Outputs come from the store in event order, so a resumed run
+            # writes the same results as an uninterrupted one
+            done = stores[j].Done()
+            one_sig[j] = np.array(stores[j].waveforms[done[0]]) if len(done) else 0
+            hist[j] = stores[j].Charges()
+            avg_sig[j] = stores[j].Average()
+            if c.get("f_features") is not None:
+                feature_rows[j] = [(done, features.FromWaveforms(stores[j].waveforms, BinWidth(ci),
+                                                                 c.get("feature_threshold"))[done])]
+            stores[j].Close()
+        else:
+            # Average of the waveforms kept, every event's with waveform_every = 1
+            avg_sig[j] /= max(n_avg[j], 1)
+
+        if c["f_timed_signal"] is not None:
+            np.save("Outputs/"+JobName(c["f_timed_signal"], j),one_sig[j])
+
+        if c["f_charge_hist"] is not None:
+            np.save("Outputs/"+JobName(c["f_charge_hist"], j),np.array(hist[j]))
+
+        if c["f_avg_timed_signal"] is not None:
+            np.save("Outputs/"+JobName(c["f_avg_timed_signal"], j),np.array(avg_sig[j]))
+
+        if c.get("f_features") is not None and feature_rows[j]:
+            job_events, job_feats = zip(*feature_rows[j])
+            np.save("Outputs/"+JobName(c["f_features"], j),
+                    features.Table(np.concatenate(job_events), np.concatenate(job_feats)))
+    profile.Add("io", time.perf_counter() - t_io)
+
+else:
+    sched.Worker(comm, Compute)
+
+## Plots, drawn by one process once its events are done (the first Worker,
+## or the Master when running alone). The events plotted are simulated
+## again with their drift lines recorded, so no event of the run records them
+PLOTS = ("plot_e_vel", "plot_ion_vel", "plot_field", "plot_mesh", "plot_drift", "plot_signal")
+plotting = any(cfg.get(key) for key in PLOTS)
+plot_interactive = plotting and cfg.get("plot_interactive", False)
+if plotting and rank == (1 if size > 1 else 0):
+    t_plots = time.perf_counter()
+    ROOT.gROOT.SetBatch(not plot_interactive)
+    plot_dir = cfg.get("plot_dir") or "Outputs/plots"
+    os.makedirs(plot_dir, exist_ok=True)
+    ci, vi = jobs[0]
+    c = cfgs[ci]
+    voltage = Voltages(c)[vi]
+    plot_obj = UseObjects(c, voltage)
+    saved = []
+
+    if c["plot_e_vel"]:
+        saved.append(plots.Velocity(plot_obj["gas"], "e", plot_dir, "e_velocity.png"))
+
+    if c["plot_ion_vel"]:
+        saved.append(plots.Velocity(plot_obj["gas"], "i", plot_dir, "ion_velocity.png"))
+
+    if c["plot_mesh"] and c.get("field_cache") is not None:
+        print("plot_mesh needs the COMSOL mesh, skipped with field_map = Grid")
+    elif c["plot_mesh"]:
+        saved.append(plots.Mesh(plot_obj["cmp"], plot_dir))
+
+    if c["plot_field"]:
+        saved.append(plots.Field(plot_obj["cmp"], voltage, plot_dir))
+
+    if c["plot_drift"] or c["plot_signal"]:
+        # Events of the first job, the last one by default
+        plot_events = c.get("plot_events")
+        if plot_events is None:
+            plot_events = [c["n_events"]-1]
+        elif not isinstance(plot_events, list):
+            plot_events = [plot_events]
+        for event in [e for e in plot_events if 0 <= e < c["n_events"]]:
+            vd = ROOT.Garfield.ViewDrift() if c["plot_drift"] else None
+            parts = np.arange(job_parts[0])
+            raw = Simulate(0, np.full(len(parts), event), parts, vd).sum(axis=0)
+            if c["plot_drift"]:
+                saved.append(plots.DriftLines(vd, plot_dir, f"drift_event{event}.png"))
+                plots.canvases.append(vd)
+            if c["plot_signal"]:
+                sig = Response(0, raw[None, :], np.array([event]))[0]
+                saved.append(plots.Signal(sig, BinWidth(ci), plot_dir, f"signal_event{event}.png"))
+
+    print(f"{len(saved)} plots written to {plot_dir}")
+    profile.Add("plots", time.perf_counter() - t_plots)
+
+profile.Count("object_builds", objects.builds)
+profile.Count("object_evictions", objects.evictions)
+if cfg.get("f_profile") is not None:
+    profile.Report(comm, "Outputs/"+cfg["f_profile"], time.perf_counter() - T_START,
+                   info={"input": args[0], "batch": batch, "resume": resume, "n_items": n_items,
+                         "drift_mode": [c["drift_mode"] for c in cfgs],
+                         "chunk_policy": cfg.get("chunk_policy", "Guided"),
+                         "master_compute": master_compute,
+                         "local_processes": LocalProcesses(cfg) if local else None})
+
+if plot_interactive:
+    # the plot canvases stay open until then
+    comm.Barrier()
+    if rank == 0:
+        input("Press any key to end\n")
 comm.Barrier()
-MPI.Finalize()
-sys.exit(0)
\ No newline at end of file
+sharedmem.Free()
+Finalize()
+sys.exit(0)
@@ -0,0 +1,155 @@
+import os
+import re
+import sys
+import json
+import math
+import Gasfiles.genGasfile as gen
+
+# Index of the gas tables in Gasfiles/, keyed by composition, pressure and
+# temperature as read from each file's Identifier line.
+#
+# The headers are parsed once and kept in Cache/gas_index.json; a file is
+# parsed again only when its size or modification time changes. A request
+# for a missing gas file with the same composition as an indexed table and a
+# gas density within tolerance is served by that table: Garfield stores the
+# transport data against reduced field, and rescales it when the pressure of
+# the loaded medium is changed, so the table is loaded with the pressure
+# that gives the requested density (Resolve, Factories.Medium).
+
+GAS_DIR = "Gasfiles"
+INDEX_PATH = os.path.join("Cache", "gas_index.json")
+# Standard atmosphere [Torr], gas file names give pressures in units of 760 Torr
+ATM = 760.0
+
+
+def ParseIdentifier(line):
+    '''
+    Composition {gas: fraction [%]}, temperature [K] and pressure [atm] of a
+    header line like "Identifier: CO2 7%, Ar 93%, T=293.15 K, p=2.96077 atm"
+    '''
+    text = line.split(":", 1)[1]
+    composition = {gas.lower(): float(frac) for gas, frac in re.findall(r"([A-Za-z0-9\-]+)\s+([0-9.eE+\-]+)%", text)}
+    T = float(re.search(r"T=\s*([0-9.eE+\-]+)\s*K", text).group(1))
+    p = float(re.search(r"p=\s*([0-9.eE+\-]+)\s*atm", text).group(1))
+
+    return composition, T, p
+
+
+def ReadHeader(path):
+    with open(path, "r", errors="replace") as fh:
+        for line in fh:
+            if line.strip().startswith("Identifier"):
+                return ParseIdentifier(line)
+    raise ValueError(f"No Identifier line in {path}")
+
+
+def Index(gas_dir=GAS_DIR, path=INDEX_PATH):
+    '''
+    {file name: entry} of every readable gas table in gas_dir, entries
+    hold composition, temperature [K] and pressure [atm]
+    '''
+    try:
+        with open(path, "r") as fh:
+            index = json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = {}
+
+    changed = False
+    names = sorted(fn for fn in os.listdir(gas_dir) if fn.endswith(".gas"))
+    for name in set(index) - set(names):
+        del index[name]
+        changed = True
+    for name in names:
+        stat = os.stat(os.path.join(gas_dir, name))
+        entry = index.get(name)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            continue
+        try:
+            composition, T, p = ReadHeader(os.path.join(gas_dir, name))
+        except (ValueError, AttributeError):
+            continue
+        index[name] = {"size": stat.st_size, "mtime": stat.st_mtime,
+                       "composition": composition, "temperature": T, "pressure": p}
+        changed = True
+
+    if changed:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(index, fh, indent=2)
+        os.replace(tmp, path)
+
+    return index
+
+
+def Request(gasfile):
+    # Composition, temperature [K] (None if not named) and pressure [atm] of a gas file name
+    gases, fractions, T, p = gen.ParseName(gasfile)
+    return dict(zip(gases, fractions)), T, (p if p is not None else 1.0)
+
+
+def Distance(gasfile, entry):
+    '''
+    (composition difference [%], |log density ratio|) between a requested
+    gas file name and an index entry. A name without a temperature is taken
+    at the temperature of the entry.
+    '''
+    composition, T, p = Request(gasfile)
+    if T is None:
+        T = entry["temperature"]
+    gases = set(composition) | set(entry["composition"])
+    dcomp = sum(abs(composition.get(g, 0.0) - entry["composition"].get(g, 0.0)) for g in gases)
+    ddens = abs(math.log((p/T)/(entry["pressure"]/entry["temperature"])))
+
+    return dcomp, ddens
+
+
+def Nearest(gasfile, n=3, index=None):
+    # The n index entries closest to a request, composition first, then density
+    index = Index() if index is None else index
+    ranked = sorted(index, key=lambda name: Distance(gasfile, index[name]))
+    return [(name, index[name]) for name in ranked[:n]]
+
+
+def Resolve(gasfile, tolerance, index=None):
+    '''
+    Closest indexed table with the same composition and a gas density within
+    tolerance (relative), as (file name, pressure [Torr]). The pressure is
+    what the table is set to so Garfield rescales it to the requested
+    density. None if no table is close enough.
+    '''
+    if tolerance is None or tolerance <= 0:
+        return None
+    index = Index() if index is None else index
+    for name, entry in Nearest(gasfile, 1, index):
+        dcomp, ddens = Distance(gasfile, entry)
+        if dcomp < 1e-3 and ddens <= math.log(1.0 + tolerance):
+            composition, T, p = Request(gasfile)
+            if T is None:
+                T = entry["temperature"]
+            return name, entry["pressure"]*ATM*(p/T)/(entry["pressure"]/entry["temperature"])
+
+    return None
+
+
+def Report(gasfile, n=3, index=None):
+    # Print the indexed tables closest to a request
+    print(f"Closest gas tables to {gasfile}:")
+    for name, entry in Nearest(gasfile, n, index):
+        dcomp, ddens = Distance(gasfile, entry)
+        mix = ", ".join(f"{g} {f:g}%" for g, f in entry["composition"].items())
+        print(f"  {name:28s} {mix}, {entry['pressure']:g} atm, {entry['temperature']:g} K"
+              f"  (composition off by {dcomp:.3g}%, density off by {100*(math.exp(ddens)-1):.3g}%)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Use: python -m Gasfiles.gasLibrary <gas file name> [tolerance]")
+        sys.exit(1)
+    tolerance = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    Report(sys.argv[1])
+    match = Resolve(sys.argv[1], tolerance)
+    if match is not None:
+        print(f"Served by {match[0]} at {match[1]:.6g} Torr")
+    else:
+        print(f"No table within {tolerance:g}, the gas file would be generated")
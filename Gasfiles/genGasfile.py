@@ -36,10 +36,9 @@ def CheckExitConditions(filename):
     
     return None
 
-def GenerateGasFile(gasfile, ncoll=11,):
-    # Check that the requested gas file is valid and does not already exist
-    CheckExitConditions(gasfile)
-    
+def ParseName(gasfile):
+    # Gases, fractions [%], temperature [K] and pressure [bar] named by a gas file,
+    # temperature and pressure are None when the name leaves them out
     # Remove extension
     name = gasfile.replace(".gas", "")
 
@@ -78,15 +77,28 @@ def GenerateGasFile(gasfile, ncoll=11,):
         fractions.append(frac)
         i += 2
 
+    # Convert fractions to normalized percentages if needed
+    total = sum(fractions)
+    fractions = [f / total * 100 for f in fractions]
+
+    return gases, fractions, T, p
+
+def GasName(gasfile):
+    # Name a gas file is written under
+    name = gasfile.replace(".gas", "")
+    if ParseName(gasfile)[2] is None:
+        name += "_0K"
+    return name
+
+def GasMedium(gasfile):
+    # Magboltz medium described by a gas file name, and the name it is written under
+    gases, fractions, T, p = ParseName(gasfile)
+
     # Easier to pad than handle different numbers of gases at magboltz init
     while len(gases) < 6:
         gases.append("")
         fractions.append(0.0)
 
-    # Convert fractions to normalized percentages if needed
-    total = sum(fractions)
-    fractions = [f / total * 100 for f in fractions]
-
     # Initialize Magboltz gas media class to set parameters and
     # and compute swarm parameters
     gas = ROOT.Garfield.MediumMagboltz(
@@ -102,8 +114,6 @@ def GenerateGasFile(gasfile, ncoll=11,):
     if T is not None:
         gas.SetTemperature(T)
         gas.EnableThermalMotion(True)
-    else:
-        name += "_0K"
         
     if len(gases[1]) > 0:
         gas.EnablePenningTransfer()
@@ -117,30 +127,154 @@ def GenerateGasFile(gasfile, ncoll=11,):
     gas.SetMaxElectronEnergy(50)
     gas.SetFieldGrid(100,50000,20,True)
     #gas.PrintGas()
+
+    return gas, GasName(gasfile)
+
+def OutputPath(name):
+    output_directory = "Gasfiles/" if os.path.exists("Gasfiles") else ""
+    return output_directory+name+".gas"
+
+def GenerateGasFile(gasfile, ncoll=11,):
+    # Check that the requested gas file is valid and does not already exist
+    CheckExitConditions(gasfile)
+
+    gas, name = GasMedium(gasfile)
+    gas.GenerateGasTable(ncoll)
     
+    print("File will be written to:")
+    print(OutputPath(name))
+    gas.WriteGasFile(OutputPath(name))
+
+    return None
+
+## Parallel generation ------------------------------------------------------------------------
+# Magboltz runs every field point independently, so the table can be split
+# by field point, each part generated on its own, and the parts merged back
+# with MergeGasFile into the same table the serial run writes.
+
+PART_DIR = "Gasfiles/parts" if os.path.exists("Gasfiles") else "parts"
+
+def FieldPoints(gasfile, gas=None):
+    # Electric fields of the grid set in GasMedium, of gas when already built
+    if gas is None:
+        gas, name = GasMedium(gasfile)
+    efields = ROOT.std.vector("double")()
+    bfields = ROOT.std.vector("double")()
+    angles = ROOT.std.vector("double")()
+    gas.GetFieldGrid(efields, bfields, angles)
+    return list(efields), list(bfields), list(angles)
+
+def PartPath(gasfile, point):
+    return os.path.join(PART_DIR, gasfile.replace(".gas", "")+f"_part{point}.gas")
+
+def GeneratePart(task, ncoll=11):
+    # Gas table of a single field point, task = (gas file, field point index)
+    gasfile, point = task
+    gas, name = GasMedium(gasfile)
+    efields, bfields, angles = FieldPoints(gasfile, gas)
+    field = ROOT.std.vector("double")([efields[point]])
+    gas.SetFieldGrid(field,
+                     ROOT.std.vector("double")(bfields),
+                     ROOT.std.vector("double")(angles))
     gas.GenerateGasTable(ncoll)
+    os.makedirs(PART_DIR, exist_ok=True)
+    gas.WriteGasFile(PartPath(gasfile, point))
+
+    return None
+
+def MergeParts(gasfile):
+    # Merge the field point tables of a gas file into one file, then remove them
+    name = GasName(gasfile)
+    n_points = len(FieldPoints(gasfile)[0])
+    merged = ROOT.Garfield.MediumMagboltz()
+    merged.LoadGasFile(PartPath(gasfile, 0))
+    for point in range(1, n_points):
+        if not merged.MergeGasFile(PartPath(gasfile, point), False):
+            print(f"Could not merge {PartPath(gasfile, point)}, parts kept")
+            return None
     
     print("File will be written to:")
-    print(f"Gasfiles/{name+".gas"}")
-    output_directory = "Gasfiles/" if os.path.exists("Gasfiles") else ""
-    gas.WriteGasFile(output_directory+name+".gas")
+    print(OutputPath(name))
+    merged.WriteGasFile(OutputPath(name))
+    for point in range(n_points):
+        os.remove(PartPath(gasfile, point))
+
+    return None
+
+def GenerateTasks(items, tasks, ncoll=11):
+    # Scheduler.Pool work function: generate the (gas file, field point) tasks numbered items
+    for i in items:
+        GeneratePart(tasks[i], ncoll)
+    return [[] for i in items]
+
+def GenerateGasFiles(gasfiles, comm=None, processes=None, ncoll=11):
+    '''
+    Generate several gas files at once, split into (gas file, field point)
+    tasks shared across the ranks of comm, or across a local pool of
+    processes when comm is None. Both None runs the tasks serially.
+    Gas files that are invalid or already exist stop the run, as in GenerateGasFile.
+    '''
+    for gasfile in gasfiles:
+        CheckExitConditions(gasfile)
+    tasks = [(gasfile, point) for gasfile in gasfiles
+             for point in range(len(FieldPoints(gasfile)[0]))]
+
+    if comm is not None:
+        # Round robin, so the slow high field points are spread over the ranks
+        rank, size = comm.Get_rank(), comm.Get_size()
+        for task in tasks[rank::size]:
+            GeneratePart(task, ncoll)
+        comm.Barrier()
+        if rank == 0:
+            for gasfile in gasfiles:
+                MergeParts(gasfile)
+        comm.Barrier()
+        return None
+
+    if processes is not None and processes > 1:
+        import functools
+        import numpy as np
+        import Arbuckle.Scheduler as sched
+        # The forked pool of the event loop, one task at a time so the slow
+        # high field points are spread over the processes
+        sched.Pool(np.arange(len(tasks)), 0, functools.partial(GenerateTasks, tasks=tasks, ncoll=ncoll),
+                   lambda items, rows: None, processes=processes, chunk_policy="Fixed", chunk_size=1,
+                   report=max(1, len(tasks)//10))
+    else:
+        for task in tasks:
+            GeneratePart(task, ncoll)
+    for gasfile in gasfiles:
+        MergeParts(gasfile)
 
     return None
 
 
 if __name__ == "__main__":
 
-    try:
-        filename = sys.argv[1]
-    except:
+    # -j N spreads the field points over N local processes,
+    # under mpirun they are spread over the ranks
+    processes = None
+    if "-j" in sys.argv:
+        processes = int(sys.argv[sys.argv.index("-j")+1])
+        del sys.argv[sys.argv.index("-j"):sys.argv.index("-j")+2]
+    filenames = sys.argv[1:]
+    if not filenames:
         print(
             "Generate New Gas Files: <gas>_<fraction>_<gas2>...<fraction-n>_<pressure>bar_<temp>C.gas"
         )
         print("Available Gases:")
         ROOT.Garfield.MediumMagboltz.PrintGases()
         print(
-            "Example: python genGasfile.py ar_93_co2_7_3bar_25C.gas"
+            "Example: python genGasfile.py ar_93_co2_7_3bar_25C.gas [more.gas ...] [-j processes]"
         )
         exit(1)
-    
-    GenerateGasFile(filename)
\ No newline at end of file
+
+    comm = None
+    if "OMPI_COMM_WORLD_SIZE" in os.environ or "PMI_SIZE" in os.environ:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD if MPI.COMM_WORLD.Get_size() > 1 else None
+
+    if comm is None and processes is None and len(filenames) == 1:
+        GenerateGasFile(filenames[0])
+    else:
+        GenerateGasFiles(filenames, comm, processes)
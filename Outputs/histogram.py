@@ -1,8 +1,23 @@
+import os
 import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
 
+def load_charges(filename):
+    """
+    Charges from a .npy histogram file or from an event store directory.
+    The store is memory-mapped, so only the charge column is read and
+    stores from runs that are still going can be plotted.
+    """
+    if os.path.isdir(filename):
+        meta = np.load(os.path.join(filename, "events.npy"), mmap_mode="r")
+        done = np.asarray(meta["done"])
+        return np.asarray(meta["charge"])[done]
+
+    return np.load(filename)
+
+
 def plot_histogram(
     filename,
     bins=100,
@@ -10,7 +25,7 @@ def plot_histogram(
     range=None
 ):
     # Load data
-    data = np.load(filename)
+    data = load_charges(filename)
 
     # Flatten in case it isn't strictly 1D
     data = np.asarray(data).ravel()
@@ -38,7 +53,7 @@ def plot_histogram(
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python histogram.py data.npy [bins]")
+        print("Usage: python histogram.py data.npy|event_store [bins]")
         sys.exit(1)
 
     filename = sys.argv[1]
@@ -1,22 +1,43 @@
+import os
 import sys
+import json
 import numpy as np
 import matplotlib.pyplot as plt
 
 
+def load_waveform(filename, event=0):
+    """
+    Waveform from a .npy file, or event number `event` from an event store
+    directory. Returns (current, dt) with dt = None when it is not known.
+    The store is memory-mapped, so only the requested row is read.
+    """
+    if os.path.isdir(filename):
+        with open(os.path.join(filename, "manifest.json"), "r") as fh:
+            manifest = json.load(fh)
+        waveforms = np.load(os.path.join(filename, "waveforms.npy"), mmap_mode="r")
+        return np.array(waveforms[event]), manifest["bin_width"]
+
+    return np.load(filename), None
+
+
 def plot_signal(
     filename,
     t_max=2000.0,
-    dt=None
+    dt=None,
+    event=0
 ):
     """
-    filename : .npy file with current samples [fC/ns]
+    filename : .npy file with current samples [fC/ns] or event store directory
     t_max    : maximum time in ns (default 2000 ns)
     dt       : optional time step in ns (if None, inferred)
+    event    : event to plot when reading an event store
     """
 
     # Load data
-    current = np.load(filename)
+    current, store_dt = load_waveform(filename, event)
     current = np.asarray(current).ravel()
+    if dt is None:
+        dt = store_dt
 
     if current.size == 0:
         raise RuntimeError("Empty waveform.")
@@ -84,10 +105,15 @@ def plot_signal(
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python signals.py waveform.npy [t_max] [dt]")
+        print("       python signals.py event_store [event] [t_max]")
         sys.exit(1)
 
     filename = sys.argv[1]
-    t_max = float(sys.argv[2]) if len(sys.argv) > 2 else 2000.0
-    dt = float(sys.argv[3]) if len(sys.argv) > 3 else None
-
-    plot_signal(filename, t_max=t_max, dt=dt)
+    if os.path.isdir(filename):
+        event = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+        t_max = float(sys.argv[3]) if len(sys.argv) > 3 else 2000.0
+        plot_signal(filename, t_max=t_max, event=event)
+    else:
+        t_max = float(sys.argv[2]) if len(sys.argv) > 2 else 2000.0
+        dt = float(sys.argv[3]) if len(sys.argv) > 3 else None
+        plot_signal(filename, t_max=t_max, dt=dt)
@@ -1,4 +1,6 @@
 import re
+import sys
+import json
 import matplotlib.pyplot as plt
 
 def parse_time_to_seconds(timestr):
@@ -50,7 +52,70 @@ def normalize_by_serial(times, nprocs):
     return [t / t1 for t in times]
 
 
-if __name__ == "__main__":
+def read_bench_file(filename):
+    """{chunk size: (nprocs, real times)} from a Tests/bench_suite.py JSON file."""
+    with open(filename, "r") as f:
+        runs = json.load(f)["runs"]
+
+    series = {}
+    for run in sorted(runs, key=lambda r: (r["chunk"], r["n_procs"])):
+        nprocs, times = series.setdefault(run["chunk"], ([], []))
+        nprocs.append(run["n_procs"])
+        times.append(run["wall_s"])
+
+    return series
+
+
+def scaling_metrics(times, nprocs):
+    """
+    Speedup S = T1/Tp, efficiency E = S/p and the Karp-Flatt serial
+    fraction e = (1/S - 1/p)/(1 - 1/p), undefined (None) at p = 1.
+    A serial fraction that grows with p points at overhead in the driver
+    rather than serial work.
+    """
+    t1 = times[nprocs.index(1)] if 1 in nprocs else None
+    if t1 is None:
+        raise RuntimeError("No NPROCS=1 entry found for normalization.")
+
+    speedup = [t1 / t for t in times]
+    efficiency = [s / p for s, p in zip(speedup, nprocs)]
+    karp_flatt = [(1/s - 1/p) / (1 - 1/p) if p > 1 else None for s, p in zip(speedup, nprocs)]
+
+    return speedup, efficiency, karp_flatt
+
+
+def plot_bench(filename, output="BenchScaling.png"):
+    series = read_bench_file(filename)
+
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4.5))
+    max_p = 1
+    for chunk, (nprocs, times) in series.items():
+        speedup, efficiency, karp_flatt = scaling_metrics(times, nprocs)
+        max_p = max(max_p, max(nprocs))
+        label = f"chunk_size = {chunk}"
+        axes[0].plot(nprocs, speedup, marker="o", label=label)
+        axes[1].plot(nprocs, efficiency, marker="o", label=label)
+        kf = [(p, e) for p, e in zip(nprocs, karp_flatt) if e is not None]
+        if kf:
+            axes[2].plot(*zip(*kf), marker="o", label=label)
+
+    axes[0].plot([1, max_p], [1, max_p], "-k", label="Ideal Scaling")
+    axes[1].axhline(1.0, color="k")
+    for ax, ylabel in zip(axes, ("Speedup (T₁ / T)", "Efficiency (S / p)", "Karp-Flatt Serial Fraction")):
+        ax.set_xlabel("Number of MPI Processes")
+        ax.set_ylabel(ylabel)
+        ax.grid(True)
+        ax.legend()
+    fig.tight_layout()
+
+    fig.savefig(output)
+
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # python Tests/Plot.py bench_suite.json [output.png]
+    plot_bench(sys.argv[1], *sys.argv[2:3])
+
+elif __name__ == "__main__":
     file1 = "mpi_time_study_1.txt" # 200 Coarse
     file2 = "mpi_time_study.txt"   # 25 Normal
 
@@ -67,7 +132,7 @@ if __name__ == "__main__":
     plt.figure()
     plt.plot(n1, t1_norm, marker="o", label="Coarse")
     plt.plot(n2, t2_norm, marker="s", label="Normal")
-    plt.plot(id_x,id_t,'-k',label="Ideal Scailing")
+    plt.plot(id_x,id_t,'-k',label="Ideal Scaling")
 
     plt.xlabel("Number of MPI Processes")
     plt.ylabel("Normalized Real Time (T / T₁)")
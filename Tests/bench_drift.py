@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import ROOT
+import Garfield # pyright: ignore[reportMissingImports]
+import Arbuckle.Factories as f
+import Arbuckle.Sources as sources
+import Arbuckle.Table as table
+from Arbuckle.TxtInput import load_config
+
+# Throughput and accuracy of the drift modes on the same events.
+# Every mode runs events 0..n-1 of the same seed, so the sources and
+# tracks match and only the drift differs. The first mode is the reference.
+# RKF takes its options from the input file (rkf_*), or from the mode name:
+# RKF+Mean, RKF+Polya, RKF+Diffusion, RKF+Mean+Diffusion, ...
+#
+# Use (from the repository root, serial):
+#   python -m Tests.bench_drift Input.txt [n_events] [mode ...]
+# e.g.
+#   python -m Tests.bench_drift Input.txt 200 MC Table
+#   python -m Tests.bench_drift Input.txt 100 MC Micro RKF RKF+Mean+Diffusion
+
+
+def Mode(cfg, name):
+    # Drift mode and RKF options [gain, Polya theta, diffusion] of a mode name
+    mode, *opts = name.split("+")
+    opts = [o.lower() for o in opts]
+    gain = next((o for o in opts if o in ("mean", "polya")), cfg.get("rkf_gain"))
+    return mode, [gain, cfg.get("rkf_polya_theta", 0.5), "diffusion" in opts or cfg.get("rkf_diffusion", False)]
+
+
+def Objects(cfg, mode):
+    gas = f.Medium([cfg["gasfile"], cfg["ionfile"]])
+    cmp = f.Component([cfg["cmp_type"], cfg["voltage"]], gas)
+    sens = f.Sensor([cfg["tmax"], cfg["sim_detail"]], cmp)
+    track = f.Track([cfg["srimfile"], cfg["trackE"], cfg["sim_detail"], cfg["straggle"]], sens)
+    drift = f.Drift([mode, cfg["sim_detail"]], sens)
+    # keep every object alive for as long as the sensor is used
+    return [gas, cmp, sens, track, drift]
+
+
+def LoadTable(cfg, sens, drift):
+    samples = cfg.get("table_samples", 20)
+    path = table.CachePath([cfg["gasfile"], cfg["voltage"], cfg["sim_detail"], cfg["tmax"], samples, "Mesh"])
+    if not os.path.exists(path):
+        axes = table.Axes(cfg["sim_detail"])
+        n_points = int(np.prod([len(a) for a in axes]))
+        print(f"Building lookup table of {n_points} points (serial)")
+        rows = f.TablePoints([cfg["sim_detail"], samples], sens, drift, np.arange(n_points))
+        table.Save(path, axes, rows, f.wbin[cfg["sim_detail"]])
+    return table.Table(table.Load(path))
+
+
+def RunMode(cfg, name, n_events):
+    mode, rkf = Mode(cfg, name)
+    t_start = time.perf_counter()
+    objs = Objects(cfg, mode)
+    gas, cmp, sens, track, drift = objs
+    lookup = LoadTable(cfg, sens, drift) if mode.lower() == "table" else None
+    t_setup = time.perf_counter() - t_start
+
+    events = np.arange(n_events)
+    srcs = sources.Sample(cfg["src_type"], cfg["seed"], events)
+    sigs = np.empty((n_events, f.SensorBins(sens)))
+    t_start = time.perf_counter()
+    for i, event in enumerate(events):
+        sigs[i] = f.Compute([mode, srcs[i], cfg["seed"], event, cfg.get("table_smear", True), 0, 1, rkf],
+                            sens, track, drift, lookup)
+    t_run = time.perf_counter() - t_start
+
+    return sigs, t_setup, t_run
+
+
+def KS(a, b):
+    # two-sample Kolmogorov-Smirnov statistic
+    grid = np.sort(np.concatenate((a, b)))
+    ca = np.searchsorted(np.sort(a), grid, side="right")/len(a)
+    cb = np.searchsorted(np.sort(b), grid, side="right")/len(b)
+    return float(np.max(np.abs(ca - cb)))
+
+
+def Overlap(a, b, bins=50):
+    # shared area of the two normalized histograms on common bins (1 = identical)
+    edges = np.histogram_bin_edges(np.concatenate((a, b)), bins=bins)
+    ha = np.histogram(a, edges)[0]/len(a)
+    hb = np.histogram(b, edges)[0]/len(b)
+    return float(np.minimum(ha, hb).sum())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m Tests.bench_drift Input.txt [n_events] [mode ...]")
+        sys.exit(1)
+
+    cfg = load_config(sys.argv[1])
+    if cfg.get("seed") is None:
+        cfg["seed"] = 1
+    n_events = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    modes = sys.argv[3:] if len(sys.argv) > 3 else ["MC", "Table"]
+
+    results = {}
+    ref = None
+    for mode in modes:
+        print(f"Running {n_events} {cfg['sim_detail']} events with drift mode {mode}")
+        sigs, t_setup, t_run = RunMode(cfg, mode, n_events)
+        charge = np.abs(sigs.sum(axis=1))
+        avg = sigs.mean(axis=0)
+        if ref is None:
+            ref = (charge, avg, t_run)
+        res = {"setup_s": t_setup,
+               "run_s": t_run,
+               "events_per_s": n_events/t_run,
+               "speedup": ref[2]/t_run,
+               "charge_mean": float(charge.mean()),
+               "charge_std": float(charge.std()),
+               "charge_mean_rel_diff": float(charge.mean()/ref[0].mean() - 1),
+               "charge_std_rel_diff": float(charge.std()/ref[0].std() - 1) if ref[0].std() > 0 else 0.0,
+               "charge_ks": KS(charge, ref[0]),
+               "charge_hist_overlap": Overlap(charge, ref[0]),
+               "avg_signal_rel_l2": float(np.linalg.norm(avg - ref[1])/np.linalg.norm(ref[1]))}
+        results[mode] = res
+        for k, v in res.items():
+            print(f"  {k:22s} {v:.4g}")
+
+    with open("Tests/bench_drift.json", "w") as fh:
+        json.dump({"n_events": n_events, "sim_detail": cfg["sim_detail"],
+                   "voltage": cfg["voltage"], "reference": modes[0], "modes": results}, fh, indent=2)
+    print("Results written to Tests/bench_drift.json")
@@ -0,0 +1,81 @@
+import sys
+import json
+import time
+import numpy as np
+import ROOT
+import Garfield # pyright: ignore[reportMissingImports]
+import Arbuckle.Factories as f
+import Arbuckle.Native as native
+import Arbuckle.FieldGrid as fieldgrid
+from Arbuckle.TxtInput import load_config
+
+# Startup time, field evaluation speed and accuracy of the regular-grid
+# field map (field_map = Grid) against the COMSOL mesh it was sampled from.
+# Fields are evaluated in C++ at random points of the mesh bounding box, so
+# the timing does not include PyROOT call overhead.
+#
+# Use (from the repository root):
+#   python -m Tests.bench_field Input.txt [n_points]
+
+
+def Timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m Tests.bench_field Input.txt [n_points]")
+        sys.exit(1)
+
+    cfg = load_config(sys.argv[1])
+    n_points = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    native.Declare("grid")
+
+    gas = f.Medium([cfg["gasfile"], cfg["ionfile"]])
+    mesh, t_mesh = Timed(f.Component, [cfg["cmp_type"], cfg["voltage"]], gas)
+
+    path, t_hash = Timed(fieldgrid.CachePath, cfg["voltage"], cfg["sim_detail"])
+    t_build = 0.0
+    if not fieldgrid.Exists(path):
+        _, t_build = Timed(f.BuildFieldGrid, [cfg["voltage"], cfg["sim_detail"], path], gas)
+    arrays, t_load = Timed(fieldgrid.Load, path)
+    grid, t_grid = Timed(f.Component, [cfg["cmp_type"], cfg["voltage"], arrays], gas)
+    t_grid += t_hash + t_load
+
+    box, field, wfield, gas_mask = arrays
+    rng = np.random.default_rng(1)
+    points = np.ascontiguousarray(box[:3] + (box[3:]-box[:3])*rng.random((n_points, 3)))
+
+    results = {}
+    for name, cmp in (("Mesh", mesh), ("Grid", grid)):
+        out = np.zeros((n_points, 4))
+        _, t_eval = Timed(ROOT.ArbuckleNative.EvaluateField, cmp, points, n_points, out)
+        results[name] = (out, t_eval)
+
+    e_mesh, e_grid = results["Mesh"][0], results["Grid"][0]
+    both = (e_mesh[:,3] == 0) & (e_grid[:,3] == 0)
+    norm_mesh = np.linalg.norm(e_mesh[both,:3], axis=1)
+    err = np.linalg.norm(e_grid[both,:3] - e_mesh[both,:3], axis=1)/np.maximum(norm_mesh, 1e-12)
+    agree = np.mean((e_mesh[:,3] == 0) == (e_grid[:,3] == 0))
+
+    report = {"voltage": cfg["voltage"],
+              "sim_detail": cfg["sim_detail"],
+              "grid_shape": list(gas_mask.shape),
+              "grid_spacing_cm": fieldgrid.SPACING[cfg["sim_detail"]],
+              "grid_build_s": t_build,
+              "startup_mesh_s": t_mesh,
+              "startup_grid_s": t_grid,
+              "eval_mesh_us": 1e6*results["Mesh"][1]/n_points,
+              "eval_grid_us": 1e6*results["Grid"][1]/n_points,
+              "eval_speedup": results["Mesh"][1]/results["Grid"][1],
+              "in_gas_agreement": float(agree),
+              "field_rel_err_median": float(np.median(err)) if err.size else 0.0,
+              "field_rel_err_p95": float(np.percentile(err, 95)) if err.size else 0.0}
+    for k, v in report.items():
+        print(f"{k:22s} {v}")
+
+    with open("Tests/bench_field.json", "w") as fh:
+        json.dump(report, fh, indent=2)
+    print("Results written to Tests/bench_field.json")
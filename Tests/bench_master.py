@@ -0,0 +1,72 @@
+import sys
+import time
+import subprocess
+import numpy as np
+
+# Synthetic benchmark of the master/worker scheduler in Arbuckle/Scheduler.py.
+# Every event burns a fixed amount of CPU so the timing reflects scheduling,
+# not physics. With the master computing its own share, -np 2 should finish
+# in about half the -np 1 time.
+#
+# Use (from the repository root):
+#   python -m Tests.bench_master [n_events] [event_cost_s] [max_np]
+
+
+def FakeEvent(cost, nbin=100):
+    t_end = time.process_time() + cost
+    x = 0.0
+    while time.process_time() < t_end:
+        x += 1.0
+    return np.zeros(nbin)
+
+
+def Run(n_events, cost, master_compute=True):
+    from mpi4py import MPI
+    import Arbuckle.Scheduler as sched
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+
+    def compute(events):
+        return np.array([FakeEvent(cost) for event in events])
+
+    comm.Barrier()
+    t0 = time.perf_counter()
+    if rank == 0:
+        done = []
+        sched.Master(comm, np.arange(n_events), 100, compute, lambda events, sigs: done.extend(events),
+                     master_compute=master_compute, report=n_events+1)
+        wall = time.perf_counter() - t0
+        cpu = time.process_time()
+        assert sorted(done) == list(range(n_events))
+        print(f"{comm.Get_size()} {wall:.3f} {cpu:.3f}")
+    else:
+        sched.Worker(comm, compute)
+
+
+def Study(n_events, cost, max_np):
+    print("# Scheduler scaling study")
+    print(f"# {n_events} events of {cost} s CPU each")
+    print("# Columns: NPROCS REAL_TIME_SECONDS MASTER_CPU_SECONDS")
+    times = {}
+    for np_ in range(1, max_np+1):
+        out = subprocess.run(["mpirun", "--oversubscribe", "-np", str(np_),
+                              sys.executable, "-m", "Tests.bench_master", "--run",
+                              str(n_events), str(cost)],
+                             capture_output=True, text=True, check=True)
+        line = out.stdout.strip().splitlines()[-1]
+        print(line)
+        times[np_] = float(line.split()[1])
+
+    if 2 in times:
+        print(f"# T2/T1 = {times[2]/times[1]:.3f} (ideal 0.5)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        Run(int(sys.argv[2]), float(sys.argv[3]))
+    else:
+        n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+        cost = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+        max_np = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+        Study(n_events, cost, max_np)
@@ -0,0 +1,89 @@
+import sys
+import json
+import time
+import subprocess
+
+# Per-rank startup time of the COMSOL component, parsed from the text files
+# (Text) against restored from the binary cache of Arbuckle/ComsolCache.py
+# (Cache). Every rank builds its component at the same time, as in a run, and
+# the slowest rank is reported.
+#
+# Use (from the repository root):
+#   python -m Tests.bench_startup Input.txt [n_procs ...]
+# e.g.
+#   python -m Tests.bench_startup Input.txt 1 4 14
+
+
+def Run(filename, mode):
+    from mpi4py import MPI
+    import ROOT
+    import Garfield # pyright: ignore[reportMissingImports]
+    import Arbuckle.Factories as f
+    import Arbuckle.ComsolCache as comsolcache
+    from Arbuckle.TxtInput import load_config
+
+    comm = MPI.COMM_WORLD
+    cfg = load_config(filename)
+    gas = f.Medium([cfg["gasfile"], cfg["ionfile"]])
+
+    comm.Barrier()
+    t0 = time.perf_counter()
+    blocks = None
+    if mode == "Cache":
+        blocks = comsolcache.Load(comsolcache.CachePath(cfg["voltage"]), cfg["voltage"])
+    cmp = f.Component([cfg["cmp_type"], cfg["voltage"], None, blocks], gas)
+    t_rank = time.perf_counter() - t0
+
+    times = comm.gather(t_rank, root=0)
+    if comm.Get_rank() == 0:
+        print(f"{comm.Get_size()} {max(times):.3f} {sum(times)/len(times):.3f}")
+
+
+def Launch(filename, mode, n_procs):
+    out = subprocess.run(["mpirun", "--oversubscribe", "-np", str(n_procs),
+                          sys.executable, "-m", "Tests.bench_startup", "--run",
+                          filename, mode],
+                         capture_output=True, text=True, check=True)
+    line = out.stdout.strip().splitlines()[-1].split()
+    return float(line[1]), float(line[2])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        Run(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+    if len(sys.argv) < 2:
+        print("Usage: python -m Tests.bench_startup Input.txt [n_procs ...]")
+        sys.exit(1)
+
+    import Arbuckle.Factories as f
+    import Arbuckle.ComsolCache as comsolcache
+    from Arbuckle.TxtInput import load_config
+
+    filename = sys.argv[1]
+    cfg = load_config(filename)
+    n_procs = [int(n) for n in sys.argv[2:]] or [1, 4]
+
+    path = comsolcache.CachePath(cfg["voltage"])
+    t_build = 0.0
+    if not comsolcache.Exists(path, cfg["voltage"]):
+        t0 = time.perf_counter()
+        if not f.BuildComsolCache([cfg["voltage"], path], f.Medium([cfg["gasfile"], cfg["ionfile"]])):
+            print("COMSOL cache could not be built with this Garfield build")
+            sys.exit(1)
+        t_build = time.perf_counter() - t0
+
+    print("# Component startup, slowest and mean rank")
+    print("# Columns: MODE NPROCS MAX_SECONDS MEAN_SECONDS")
+    results = {}
+    for n in n_procs:
+        for mode in ("Text", "Cache"):
+            t_max, t_mean = Launch(filename, mode, n)
+            print(f"{mode:5s} {n} {t_max:.3f} {t_mean:.3f}")
+            results.setdefault(str(n), {})[mode] = {"max_s": t_max, "mean_s": t_mean}
+        res = results[str(n)]
+        res["speedup"] = res["Text"]["max_s"]/res["Cache"]["max_s"]
+
+    with open("Tests/bench_startup.json", "w") as fh:
+        json.dump({"voltage": cfg["voltage"], "cache_build_s": t_build, "n_procs": results}, fh, indent=2)
+    print("Results written to Tests/bench_startup.json")
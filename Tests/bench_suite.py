@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import glob
+import shutil
+import tempfile
+import functools
+import subprocess
+import time
+import numpy as np
+import Arbuckle.Profile as profile
+
+# Benchmark suite of the MPI driver without the physics stack.
+# Arbuckle/main.py runs as it is, with MockCompute standing in for
+# Factories.Compute and empty Garfield objects: every event burns a set
+# amount of CPU and returns a waveform of a set length, so the timings
+# reflect main.py's scheduling, messaging, aggregation on the master
+# (Collect, Assemble, Converge, event store) and output I/O only.
+# Each (process count, chunk size) point runs Input.txt under mpirun through
+# a batch manifest of overrides, with f_profile on, and the results are
+# written to Tests/bench_suite.json for Tests/Plot.py (speedup, efficiency,
+# Karp-Flatt).
+#
+# Use (from the repository root):
+#   python -m Tests.bench_suite [--events N] [--cost S] [--nbin N]
+#                               [--np 1,2,4] [--chunk 1,8] [--store]
+#                               [--set "key = value; ..."] [--out file.json]
+# e.g. messaging overhead alone, with free events and long waveforms:
+#   python -m Tests.bench_suite --cost 0 --nbin 20000 --np 1,2,4,8
+# or split events and a convergence monitor on the master:
+#   python -m Tests.bench_suite --set "cluster_parts = 4; converge_mean = 0.001"
+
+# Phases of main.py before its first event, left out of the timings
+STARTUP = ("import", "gas_generation", "setup")
+
+# Input keys of every benchmark run, see Launch
+BASE = {"sim_detail": "Coarse", "voltage": 200, "field_map": "Mesh", "comsol_cache": False,
+        "f_timed_signal": "bench_suite_sig.npy", "f_avg_timed_signal": "bench_suite_avg.npy",
+        "f_charge_hist": "bench_suite_hist.npy", "f_features": None, "f_convergence": None,
+        "seed": 1, "master_compute": True, "local_processes": None, "plot_e_vel": False,
+        "plot_ion_vel": False, "plot_field": False, "plot_mesh": False, "plot_drift": False,
+        "plot_signal": False}
+
+
+def MockCompute(inputs, sens, track, drift, lookup=None, cost=0.0, nbin=1):
+    '''
+    Stand-in for Factories.Compute: cost [s] of CPU, then a pulse of nbin
+    bins whose amplitude depends on the event ID only, shared out evenly
+    between the cluster parts of a split event. Every event is counted
+    once, for the throughput of runs a convergence monitor stops early
+    '''
+    t_end = time.process_time() + cost
+    x = 0.0
+    while time.process_time() < t_end:
+        x += 1.0
+    event, part, n_parts = inputs[3], inputs[5], inputs[6]
+    if part == 0:
+        profile.Count("events")
+    amp = (1.0 + (event % 97)/97)/n_parts
+    return amp*np.exp(-np.arange(nbin)/(0.1*nbin))
+
+
+def Run(params):
+    # Arbuckle/main.py on the manifest, with the physics stubbed out
+    import runpy
+    import Arbuckle.Factories as f
+    import Gasfiles.genGasfile
+
+    f.Medium = lambda inputs: None
+    for name in ("Component", "Sensor", "Track", "Drift"):
+        setattr(f, name, lambda inputs, obj: None)
+    f.Release = lambda cmp: None
+    f.NBins = lambda tmax, detail: params["nbin"]
+    f.Compute = functools.partial(MockCompute, cost=params["cost"], nbin=params["nbin"])
+    Gasfiles.genGasfile.FileExists = lambda filename: True
+
+    sys.argv = ["Arbuckle/main.py", "--batch", params["manifest"]]
+    runpy.run_module("Arbuckle.main", run_name="__main__", alter_sys=True)
+
+
+def Launch(params, n_procs):
+    '''
+    One run of main.py on n_procs ranks. Returns its profile, with wall_s
+    the time from the end of main.py's setup to its end on the master
+    '''
+    profile_name = f"bench_suite_{os.getpid()}.json"
+    overrides = dict(BASE, n_events=params["events"], f_profile=profile_name,
+                     chunk_policy=params["policy"], chunk_size=params["chunk"],
+                     f_event_store="bench_suite_store" if params["store"] else None)
+    line = "; ".join(["Input.txt"] + [f"{key} = {value}" for key, value in overrides.items()])
+    if params["set"]:
+        line += "; " + params["set"]
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as manifest:
+        manifest.write(line + "\n")
+    try:
+        subprocess.run(["mpirun", "--oversubscribe", "-np", str(n_procs), sys.executable,
+                        "-m", "Tests.bench_suite", "--run", json.dumps(dict(params, manifest=manifest.name))],
+                       capture_output=True, text=True, check=True)
+        with open(os.path.join("Outputs", profile_name)) as fh:
+            report = json.load(fh)
+    finally:
+        os.remove(manifest.name)
+        for path in glob.glob(os.path.join("Outputs", "bench_suite_*")):
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    master = report["ranks"][0]
+    wall = master["wall_s"] - sum(master["timers"].get(name, {"s": 0.0})["s"] for name in STARTUP)
+    return {"wall_s": wall,
+            "throughput": report["summary"]["counters"].get("events", 0)/wall,
+            "summary": report["summary"]}
+
+
+def Option(name, default, kind=str):
+    if name in sys.argv:
+        return kind(sys.argv[sys.argv.index(name)+1])
+    return default
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--run":
+        Run(json.loads(sys.argv[2]))
+        sys.exit(0)
+
+    base = {"events": Option("--events", 400, int),
+            "cost": Option("--cost", 0.01, float),
+            "nbin": Option("--nbin", 2000, int),
+            "policy": Option("--policy", "Guided"),
+            "store": "--store" in sys.argv,
+            "set": Option("--set", "")}
+    n_procs = [int(n) for n in Option("--np", "1,2,4").split(",")]
+    chunks = [int(n) for n in Option("--chunk", "1,8").split(",")]
+    path = Option("--out", "Tests/bench_suite.json")
+
+    print(f"# {base['events']} mock events of {base['cost']} s CPU and {base['nbin']} bins")
+    print("# Columns: CHUNK NPROCS REAL_TIME_SECONDS EVENTS_PER_SECOND MPI_WAIT_S COLLECT_S IO_S MB_SENT")
+    runs = []
+    for chunk in chunks:
+        for n in n_procs:
+            res = Launch(dict(base, chunk=chunk), n)
+            phases = res["summary"]["phases"]
+            mb = res["summary"]["counters"].get("bytes_sent", 0)/1e6
+            print(f"{chunk} {n} {res['wall_s']:.3f} {res['throughput']:.1f} "
+                  f"{phases.get('mpi_wait', {}).get('max_s', 0):.3f} "
+                  f"{phases.get('collect', {}).get('max_s', 0):.3f} "
+                  f"{phases.get('io', {}).get('max_s', 0):.3f} {mb:.1f}")
+            runs.append(dict(res, chunk=chunk, n_procs=n))
+
+    with open(path, "w") as fh:
+        json.dump({"params": base, "runs": runs}, fh, indent=2)
+    print(f"Results written to {path}")
@@ -0,0 +1,32 @@
+import json
+import numpy as np
+from Arbuckle.Convergence import Monitor
+
+# Restoring the stop of a run in a resumed one (python -m pytest Tests/test_convergence.py)
+
+
+def Stopped(charges):
+    monitor = Monitor(mean=0.05, min_events=10, every=10, patience=2)
+    for i in range(0, len(charges), 7):
+        monitor.Update(charges[i:i+7])
+    return monitor
+
+
+def test_restore_matches_original_stop():
+    charges = np.random.default_rng(1).normal(100.0, 5.0, 200)
+    original = Stopped(charges)
+    assert original.reason is not None
+    state = json.loads(json.dumps(original.State()))
+
+    resumed = Monitor(mean=0.05, min_events=10, every=10, patience=2)
+    assert resumed.Restore(state) == original.reason
+    assert resumed.Report(200, 50) == original.Report(200, 50)
+
+
+def test_restore_ignored_after_settings_change():
+    charges = np.random.default_rng(1).normal(100.0, 5.0, 200)
+    state = json.loads(json.dumps(Stopped(charges).State()))
+
+    resumed = Monitor(mean=0.01, min_events=10, every=10, patience=2)
+    assert resumed.Restore(state) is None
+    assert resumed.reason is None
@@ -0,0 +1,31 @@
+import numpy as np
+from Arbuckle.EventStore import EventStore
+
+# Resume of an event store (python -m pytest Tests/test_eventstore.py)
+
+
+def test_resume_with_gas_scaled(tmp_path):
+    # gas_scaled comes from gasLibrary.Resolve as a tuple, stored as a JSON list
+    info = {"gasfile": "ar_100_4bar_25C.gas", "gas_scaled": ("ar_100_5bar_25C.gas", 3040.0), "seed": 1}
+    path = str(tmp_path/"store")
+    store = EventStore(path, 4, 3, 20.0, info=info)
+    store.Write(np.array([0, 2]), np.ones((2, 3)))
+    store.Close()
+
+    store = EventStore(path, 4, 3, 20.0, info=dict(info), resume=True)
+    assert list(store.Remaining()) == [1, 3]
+    store.Close()
+
+
+def test_resume_keeps_stop(tmp_path):
+    # A convergence stop recorded by the driver survives the resume
+    path = str(tmp_path/"store")
+    store = EventStore(path, 4, 3, 20.0, info={"seed": 1})
+    store.Write(np.array([1]), np.ones((1, 3)))
+    store.manifest["stop"] = {"reason": "converged after 1 events"}
+    store.Close()
+
+    store = EventStore(path, 4, 3, 20.0, info={"seed": 1}, resume=True)
+    assert store.manifest["stop"] == {"reason": "converged after 1 events"}
+    assert store.manifest["n_done"] == 1
+    store.Close()
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import types
+import importlib
+import pytest
+
+# Field-point parallel gas generation against a single pass, with a stub
+# MediumMagboltz standing in for Magboltz (python -m pytest Tests/test_genGasfile.py)
+
+GASFILE = "ar_90_co2_10_3bar_25C.gas"
+
+
+class Vector(list):
+    pass
+
+
+class Medium:
+    '''
+    Stub of ROOT.Garfield.MediumMagboltz: the gas table holds one row per
+    field point, computed from the field and the gas settings, and gas files
+    are JSON
+    '''
+
+    builds = 0
+
+    def __init__(self, *mixture):
+        Medium.builds += len(mixture) > 0
+        self.settings = {"mixture": list(mixture), "temperature": None, "thermal": False,
+                         "penning": False, "pressure": None, "max_energy": None}
+        self.fields = ([], [], [])
+        self.table = []
+
+    def SetTemperature(self, T):
+        self.settings["temperature"] = T
+
+    def EnableThermalMotion(self, on):
+        self.settings["thermal"] = on
+
+    def EnablePenningTransfer(self):
+        self.settings["penning"] = True
+
+    def SetPressure(self, p):
+        self.settings["pressure"] = p
+
+    def EnableAutoEnergyLimit(self, on):
+        pass
+
+    def SetMaxElectronEnergy(self, e):
+        self.settings["max_energy"] = e
+
+    def SetFieldGrid(self, *args):
+        if len(args) == 4:
+            emin, emax, n, log = args
+            step = (emax/emin)**(1.0/(n - 1))
+            self.fields = ([emin*step**i for i in range(n)], [0.0], [0.0])
+        else:
+            self.fields = tuple(list(a) for a in args)
+
+    def GetFieldGrid(self, efields, bfields, angles):
+        for out, values in zip((efields, bfields, angles), self.fields):
+            out.extend(values)
+
+    def GenerateGasTable(self, ncoll):
+        p = self.settings["pressure"]
+        self.table = [[e, e/p, 1.0 + self.settings["penning"], ncoll] for e in self.fields[0]]
+
+    def WriteGasFile(self, path):
+        with open(path, "w") as fh:
+            json.dump({"settings": self.settings, "fields": self.fields, "table": self.table}, fh)
+
+    def LoadGasFile(self, path):
+        with open(path) as fh:
+            data = json.load(fh)
+        self.settings, self.fields, self.table = data["settings"], data["fields"], data["table"]
+        return True
+
+    def MergeGasFile(self, path, replace_old):
+        other = Medium()
+        other.LoadGasFile(path)
+        if other.settings != self.settings:
+            return False
+        rows = {row[0]: row for row in self.table}
+        for row in other.table:
+            if replace_old or row[0] not in rows:
+                rows[row[0]] = row
+        self.table = [rows[e] for e in sorted(rows)]
+        self.fields = (sorted(rows), self.fields[1], self.fields[2])
+        return True
+
+
+@pytest.fixture
+def gen(monkeypatch, tmp_path):
+    root = types.SimpleNamespace(Garfield=types.SimpleNamespace(MediumMagboltz=Medium),
+                                 std=types.SimpleNamespace(vector=lambda kind: Vector))
+    monkeypatch.setitem(sys.modules, "ROOT", root)
+    monkeypatch.setitem(sys.modules, "Garfield", types.ModuleType("Garfield"))
+    monkeypatch.delitem(sys.modules, "Gasfiles.genGasfile", raising=False)
+    monkeypatch.syspath_prepend(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module("Gasfiles.genGasfile")
+    module.PART_DIR = "parts"
+    yield module
+    sys.modules.pop("Gasfiles.genGasfile", None)
+
+
+def test_merged_parts_match_single_pass(gen):
+    name = gen.GasName(GASFILE) + ".gas"
+    gen.GenerateGasFile(GASFILE)
+    os.rename(name, "serial.gas")
+
+    gen.GenerateGasFiles([GASFILE])
+    with open("serial.gas") as fh:
+        serial = json.load(fh)
+    with open(name) as fh:
+        merged = json.load(fh)
+
+    assert merged["fields"][0] == serial["fields"][0]
+    assert sorted(merged["fields"][0]) == merged["fields"][0]
+    assert len(merged["table"]) == len(serial["table"]) == 20
+    assert merged["table"] == serial["table"]
+    assert merged["settings"] == serial["settings"]
+    assert merged["settings"]["penning"] and merged["settings"]["thermal"]
+    assert os.listdir("parts") == []
+
+
+def test_part_builds_one_medium(gen):
+    Medium.builds = 0
+    gen.GeneratePart((GASFILE, 3))
+    assert Medium.builds == 1
@@ -103,12 +103,20 @@ source "$(conda info --base)/envs/garfield/garfieldpp/install/share/Garfield/set
 # --- Arbuckle MPI wrapper ---
 arbuckle() {
     if [ "$#" -lt 1 ]; then
-        echo "Usage: arbuckle [mpirun options] <input-file>"
+        echo "Usage: arbuckle [mpirun options] [--resume] [--batch] <input-file or manifest>"
         echo "Example: arbuckle -np 4 Input.txt"
         return 1
     fi
 
-    mpi_args=("$@")
+    # Arbuckle flags are passed to python, everything else to mpirun
+    mpi_args=()
+    arb_args=()
+    for arg in "$@"; do
+        case "$arg" in
+            --resume|--batch) arb_args+=("$arg") ;;
+            *) mpi_args+=("$arg") ;;
+        esac
+    done
 
     # Index of last element
     last=$(( ${#mpi_args[@]} - 1 ))
@@ -116,7 +124,7 @@ arbuckle() {
     input="${mpi_args[$last]}"
     unset 'mpi_args[$last]'
 
-    mpirun "${mpi_args[@]}" python -m Arbuckle.main "$input"
+    mpirun "${mpi_args[@]}" python -m Arbuckle.main "${arb_args[@]}" "$input"
 }
 
 export -f arbuckle